@@ -0,0 +1,97 @@
+# This file is part of Mimir.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Routing and failover of the Ollama endpoint pools against local stub servers.
+Starts --endpoints chat stubs plus one embedding stub, sends concurrent
+streamed chat requests through the chat pool, makes one endpoint fail halfway
+through and reports how requests were spread and how many failed over.
+
+    python -m benchmarks.ollama_pool --endpoints 3 --requests 60 --concurrency 6
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.run import summarize
+from benchmarks.stub_ollama import StubOllamaServer
+import config
+
+def main():
+    parser = argparse.ArgumentParser(description="Mimir Ollama pool routing/failover benchmark")
+    parser.add_argument("--endpoints", type=int, default=3, help="Chat stub servers")
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=6)
+    parser.add_argument("--fail-after", type=float, default=0.5,
+                        help="Fraction of requests after which the first endpoint starts answering 503")
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    model_name = config.DEFAULT_MODEL
+    chat_servers = [StubOllamaServer(models=[model_name]) for _ in range(args.endpoints)]
+    # The last chat endpoint lacks the model: routing must skip it
+    chat_servers.append(StubOllamaServer(models=[]))
+    embed_server = StubOllamaServer(models=[config.EMBEDDING_MODEL])
+
+    config.OLLAMA_CHAT_URLS = [s.start() for s in chat_servers]
+    config.OLLAMA_EMBED_URLS = [embed_server.start()]
+    config.OLLAMA_BASE_URL = config.OLLAMA_CHAT_URLS[0]
+
+    from modules import llm
+    from modules.metrics import OLLAMA_REQUESTS
+
+    chat = llm.get_llm(model_name)
+    embeddings = llm.get_embeddings()
+    fail_at = int(args.requests * args.fail_after)
+
+    def ask(i):
+        if i == fail_at:
+            chat_servers[0].settings.failing = True
+        start = time.perf_counter()
+        tokens = sum(1 for _ in chat.stream(f"Question {i} about Mimir?"))
+        embeddings.embed_query(f"Question {i} about Mimir?")
+        return time.perf_counter() - start, tokens
+
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                results = list(executor.map(ask, range(args.requests)))
+    finally:
+        for server in chat_servers + [embed_server]:
+            server.stop()
+
+    output = json.dumps({
+        "parameters": vars(args),
+        "latency": summarize([seconds for seconds, _ in results]),
+        "chat_requests": {s.url: s.settings.requests["chat"] for s in chat_servers},
+        "embed_requests": {
+            s.url: s.settings.requests["embed"] for s in chat_servers + [embed_server] if s.settings.requests["embed"]
+        },
+        "failovers": OLLAMA_REQUESTS.total(status="failover"),
+        "failed_endpoint": chat_servers[0].url
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    sys.exit(main())
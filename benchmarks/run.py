@@ -0,0 +1,210 @@
+# This file is part of Mimir.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Offline benchmark suite: runs the real ingestor and rag_engine code against
+a stub Ollama server and in-memory Neo4j stand-ins, then prints JSON.
+
+    python -m benchmarks.run --docs 20 --questions 50 --output bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from benchmarks.stub_ollama import StubOllamaServer
+from benchmarks.standins import StandInGraph, StandInVectorStore
+import config
+
+VOCABULARY = [
+    "Odin", "Mimir", "Yggdrasil", "Asgard", "Midgard", "Thor", "Loki", "Freya", "Bifrost",
+    "Valhalla", "Heimdall", "Fenrir", "Jotunheim", "Norns", "Ragnarok", "Baldr"
+]
+FILLER = "the of and knowledge graph wisdom well guards drinks sacrifices ancient tree world".split()
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99)
+    }
+
+def synthetic_corpus(docs, paragraphs, seed):
+    """Deterministic documents mixing mythological entities with filler words."""
+    from langchain_core.documents import Document
+    rng = random.Random(seed)
+    corpus = []
+    for d in range(docs):
+        pages = []
+        for p in range(paragraphs):
+            words = [rng.choice(VOCABULARY) if rng.random() < 0.2 else rng.choice(FILLER) for _ in range(120)]
+            pages.append(Document(page_content=" ".join(words) + ".", metadata={"page": p}))
+        corpus.append((f"doc-{d}.txt", pages))
+    return corpus
+
+def bench_ingestion(ingestor, corpus, graph, model_name, label):
+    durations = []
+    chunks = 0
+    cache_hits = 0
+    extraction_calls = 0
+    stages = {}
+    start = time.perf_counter()
+    for source_name, pages in corpus:
+        stats = ingestor._run_pipeline(iter(pages), graph, model_name, source_name)
+        durations.append(stats["duration"])
+        chunks += stats["pages"]
+        cache_hits += stats["cache_hits"]
+        extraction_calls += stats["extraction_calls"]
+        for stage, timing in stats["timings"].items():
+            stages.setdefault(stage, []).append(timing["seconds"])
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": label,
+        "documents": len(corpus),
+        "chunks": chunks,
+        "cache_hits": cache_hits,
+        "extraction_calls": extraction_calls,
+        "seconds": elapsed,
+        "chunks_per_sec": chunks / elapsed if elapsed else None,
+        "document_seconds": summarize(durations),
+        "stages": {stage: summarize(values) for stage, values in stages.items()}
+    }
+
+def bench_queries(rag_engine, graph, model_name, questions, label, answer_cache):
+    config.ANSWER_CACHE_ENABLED = answer_cache
+    rag_engine.answer_cache.clear()
+    engine = rag_engine.get_qa_chain(graph_db=graph, model_name=model_name)
+
+    totals, ttft, stages, prompt_tokens, raw_prompt_tokens = [], [], {}, [], []
+    for question in questions:
+        start = time.perf_counter()
+        stream = engine.stream_query(question)
+        for _ in stream:
+            pass
+        totals.append(time.perf_counter() - start)
+        for stage, timing in stream.timings.items():
+            stages.setdefault(stage, []).append(timing["seconds"])
+        if "first_token" in stream.timings:
+            ttft.append(stream.timings["first_token"]["seconds"])
+        if stream.context:
+            prompt_tokens.append(stream.context["prompt_tokens"])
+            raw_prompt_tokens.append(stream.context["raw_prompt_tokens"])
+
+    return {
+        "scenario": label,
+        "questions": len(questions),
+        "latency": summarize(totals),
+        "time_to_first_token": summarize(ttft),
+        "prompt_tokens": summarize(prompt_tokens),
+        "raw_prompt_tokens": summarize(raw_prompt_tokens),
+        "stages": {stage: summarize(values) for stage, values in stages.items()}
+    }
+
+def run_scenarios(args, ingestor, rag_engine, model_name, server):
+    graph = StandInGraph(latency=args.graph_latency)
+    corpus = synthetic_corpus(args.docs, args.paragraphs, args.seed)
+    rng = random.Random(args.seed)
+    # Questions repeat, as they do in production, so the caches have something to hit
+    pool = [
+        f"How is {rng.choice(VOCABULARY)} related to {rng.choice(VOCABULARY)}?"
+        for _ in range(max(1, args.questions // 3))
+    ]
+    questions = [rng.choice(pool) for _ in range(args.questions)]
+
+    return {
+        "timestamp": time.time(),
+        "parameters": vars(args),
+        "scenarios": [
+            bench_ingestion(ingestor, corpus, graph, model_name, "ingest_cold"),
+            # Same corpus again: extraction and embeddings come from the caches
+            bench_ingestion(ingestor, corpus, graph, model_name, "ingest_warm"),
+            bench_queries(rag_engine, graph, model_name, questions, "query", answer_cache=False),
+            bench_queries(rag_engine, graph, model_name, questions, "query_answer_cache", answer_cache=True)
+        ],
+        "stub_requests": dict(server.settings.requests)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Mimir offline benchmarks")
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--paragraphs", type=int, default=8, help="Pages per synthetic document")
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--chat-latency", type=float, default=0.05, help="Stub seconds before first token")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Stub seconds per token")
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="Stub seconds per embed request")
+    parser.add_argument("--graph-latency", type=float, default=0.002, help="Stand-in seconds per graph/vector call")
+    parser.add_argument("--vector-backend", choices=["neo4j", "local"], default="neo4j",
+                        help="'local' queries the on-disk index instead of the vector store stand-in")
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    model_name = config.DEFAULT_MODEL
+    server = StubOllamaServer(
+        models=[model_name, config.EMBEDDING_MODEL],
+        chat_latency=args.chat_latency,
+        token_latency=args.token_latency,
+        embed_latency=args.embed_latency
+    )
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Configuration must be in place before the modules build their singletons
+        config.OLLAMA_BASE_URL = server.start()
+        config.OLLAMA_CHAT_URLS = config.OLLAMA_EMBED_URLS = [config.OLLAMA_BASE_URL]
+        config.CACHE_DIR = cache_dir
+        config.EXTRACTION_CACHE_PATH = os.path.join(cache_dir, "extraction.sqlite")
+        config.EMBEDDING_CACHE_PATH = os.path.join(cache_dir, "embeddings.sqlite")
+        config.CYPHER_CACHE_HISTORY_PATH = os.path.join(cache_dir, "cypher_history.jsonl")
+        config.LOCAL_VECTOR_DIR = os.path.join(cache_dir, "vectors")
+        config.VECTOR_BACKEND = args.vector_backend
+
+        from modules import ingestor, rag_engine
+        ingestor.Neo4jVector = StandInVectorStore
+        rag_engine.Neo4jVector = StandInVectorStore
+        StandInVectorStore.reset(latency=args.graph_latency)
+
+        # Mimir's own progress prints go to stderr so stdout stays valid JSON
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                results = run_scenarios(args, ingestor, rag_engine, model_name, server)
+        finally:
+            server.stop()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+# This file is part of Mimir.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+In-memory stand-ins for Neo4j: a graph that understands the queries Mimir's
+writers and retrievers issue, and a vector store with Neo4jVector's interface.
+Each call sleeps for a configurable round-trip time to mimic Bolt.
+"""
+
+import math
+import re
+import threading
+import time
+import uuid
+from langchain_core.documents import Document
+
+_FULLTEXT_TERM = re.compile(r'queryNodes\(\s*["\'][^"\']+["\']\s*,\s*["\']([^"\']+)["\']')
+
+class StandInGraph:
+    """Neo4jGraph replacement covering writes (UNWIND upserts), entity lookups and graph expansion."""
+    def __init__(self, latency=0.002):
+        self.latency = latency
+        self.nodes = {}          # id -> type
+        self.relationships = {}  # (source, target, type) -> properties
+        self.version = None      # Graph version token (meta node)
+        self.mentions = {}       # chunk id -> set(entity ids)
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    @property
+    def get_schema(self):
+        with self._lock:
+            labels = sorted(set(self.nodes.values()))
+            rel_types = sorted({t for (_, _, t) in self.relationships})
+        return (
+            "Node properties:\n" + "\n".join(f"{label} {{id: STRING}}" for label in labels) +
+            "\nThe relationships:\n" + "\n".join(f"(:Concept)-[:{t}]->(:Concept)" for t in rel_types)
+        )
+
+    def refresh_schema(self):
+        time.sleep(self.latency)
+
+    def query(self, query, params=None):
+        time.sleep(self.latency)
+        params = params or {}
+        rows = params.get("rows", [])
+        with self._lock:
+            self.queries += 1
+            if "MERGE (n:" in query:
+                for row in rows:
+                    label = re.search(r"SET n:`([^`]*)`", query)
+                    self.nodes[row["id"]] = label.group(1) if label else "Node"
+                return []
+            if "MERGE (s)-[r:" in query:
+                rel_type = re.search(r"MERGE \(s\)-\[r:`([^`]*)`\]", query).group(1)
+                for row in rows:
+                    self.relationships[(row["source"], row["target"], rel_type)] = row["properties"]
+                return []
+            if "[:MENTIONS]->(e)" in query and "MERGE" in query:
+                for row in rows:
+                    self.mentions.setdefault(row["chunk"], set()).update(row["entities"])
+                return []
+
+            if ":__Mimir__" in query:
+                if "SET m.version" in query:
+                    self.version = uuid.uuid4().hex
+                return [{"version": self.version}] if self.version else []
+            if "[:MENTIONS]->(seed" in query:
+                return [self._expand(query, params)]
+            if "MATCH (c:Chunk) WHERE c.embedding IS NOT NULL RETURN count(c)" in query:
+                return [{"total": len(StandInVectorStore.chunks)}]
+
+            match = _FULLTEXT_TERM.search(query)
+            if match:
+                terms = {t.lower() for t in re.findall(r"\w+", match.group(1)) if t != "AND"}
+                return [
+                    {"n": {"id": s}, "r": [s, rel, o], "m": {"id": o}}
+                    for (s, o, rel) in self.relationships
+                    if s.lower() in terms or o.lower() in terms
+                ]
+            return []
+
+    def _expand(self, query, params):
+        """Graph expansion retrieval: vector top-k (or given chunk ids) + entity neighbourhood."""
+        if "db.index.vector.queryNodes" in query:
+            with StandInVectorStore._lock:
+                scored = sorted(
+                    ((cid, doc, _cosine(params["embedding"], vector)) for cid, (doc, vector) in StandInVectorStore.chunks.items()),
+                    key=lambda item: item[2], reverse=True
+                )[:params["k"]]
+            chunk_ids = [cid for cid, _, _ in scored]
+            chunks = [{"id": cid, "text": doc.page_content, "source": doc.metadata.get("source"),
+                       "page": doc.metadata.get("page"), "score": score} for cid, doc, score in scored]
+        else:
+            chunk_ids = params["ids"]
+            chunks = []
+
+        hops = int(re.search(r"\[\*1\.\.(\d+)\]", query).group(1))
+        frontier = set().union(*(self.mentions.get(cid, set()) for cid in chunk_ids))
+        seen_seeds = set(frontier)
+        seen, triples = set(frontier), []
+        for _ in range(hops):
+            reached = set()
+            for (source, target, rel_type) in self.relationships:
+                if (source in frontier or target in frontier) and [source, rel_type, target] not in triples:
+                    triples.append([source, rel_type, target])
+                    reached.update({source, target} - seen)
+            seen |= reached
+            frontier = reached
+        return {"chunks": chunks, "triples": triples[:params["limit"]], "seeds": len(seen_seeds)}
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+class StandInVectorStore:
+    """
+    Neo4jVector replacement: one shared in-memory index of Chunk documents.
+    Exposes the constructors Mimir uses (from_documents, from_embeddings, from_existing_graph).
+    """
+    chunks = {}        # id -> (Document, embedding)
+    latency = 0.002
+    _lock = threading.Lock()
+
+    def __init__(self, embedding):
+        self.embedding = embedding
+
+    @classmethod
+    def reset(cls, latency=0.002):
+        cls.chunks = {}
+        cls.latency = latency
+
+    @classmethod
+    def from_documents(cls, documents, embedding, ids=None, **kwargs):
+        store = cls(embedding)
+        store.add_documents(documents, ids=ids)
+        return store
+
+    @classmethod
+    def from_embeddings(cls, text_embeddings, embedding, metadatas=None, ids=None, **kwargs):
+        store = cls(embedding)
+        texts = [text for text, _ in text_embeddings]
+        store.add_embeddings(texts, [vector for _, vector in text_embeddings], metadatas=metadatas, ids=ids)
+        return store
+
+    @classmethod
+    def from_existing_graph(cls, embedding, **kwargs):
+        return cls(embedding)
+
+    def add_documents(self, documents, ids=None):
+        ids = ids or [getattr(d, "id", None) or str(len(self.chunks) + i) for i, d in enumerate(documents)]
+        vectors = self.embedding.embed_documents([d.page_content for d in documents])
+        return self.add_embeddings(
+            [d.page_content for d in documents], vectors, metadatas=[d.metadata for d in documents], ids=ids
+        )
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None, **kwargs):
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(len(self.chunks) + i) for i in range(len(texts))]
+        time.sleep(self.latency)
+        with self._lock:
+            for chunk_id, text, metadata, vector in zip(ids, texts, metadatas, embeddings):
+                self.chunks[chunk_id] = (Document(page_content=text, metadata=dict(metadata)), vector)
+        return ids
+
+    def similarity_search_by_vector(self, vector, k=4):
+        time.sleep(self.latency)
+        with self._lock:
+            scored = sorted(self.chunks.values(), key=lambda item: _cosine(vector, item[1]), reverse=True)
+        return [Document(page_content=d.page_content, metadata=dict(d.metadata)) for d, _ in scored[:k]]
+
+    def similarity_search(self, query, k=4):
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k=k)
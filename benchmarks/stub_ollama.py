@@ -0,0 +1,257 @@
+# This file is part of Mimir.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Deterministic stand-in for the Ollama HTTP API (tags, pull, chat, embed).
+
+Responses are derived from the request text only, so two runs over the same
+input produce identical graphs, embeddings and answers. Latency is simulated
+with configurable sleeps instead of real inference.
+"""
+
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIM = 64
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9_]+")
+_ENTITY = re.compile(r"\b[A-Z][a-z]{2,}\b")
+
+def stub_embedding(text, dim=EMBEDDING_DIM):
+    """Hashed bag-of-words vector: similar texts get similar (unit) vectors."""
+    vector = [0.0] * dim
+    for word in _WORD.findall(text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        vector[digest[0] % dim] += 1.0 if digest[1] % 2 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+def stub_graph(text, max_entities=6):
+    """Capitalized words become entities, consecutive ones get related."""
+    entities = list(dict.fromkeys(_ENTITY.findall(text)))[:max_entities]
+    nodes = [{"id": e, "type": "Concept"} for e in entities]
+    relationships = [
+        {
+            "source_node_id": a, "source_node_type": "Concept",
+            "target_node_id": b, "target_node_type": "Concept",
+            "type": "RELATED_TO"
+        }
+        for a, b in zip(entities, entities[1:])
+    ]
+    return {"nodes": nodes, "relationships": relationships}
+
+class StubSettings:
+    def __init__(self, models=(), chat_latency=0.05, token_latency=0.005, answer_tokens=40, embed_latency=0.01):
+        self.models = list(models)
+        self.chat_latency = chat_latency        # Seconds before the first token (prefill)
+        self.token_latency = token_latency      # Seconds per generated token
+        self.answer_tokens = answer_tokens
+        self.embed_latency = embed_latency      # Seconds per embed request
+        self.requests = {"chat": 0, "embed": 0, "tags": 0, "pull": 0}
+        self.in_flight = 0
+        self.failing = False                    # When set, every API request answers 503 (failover tests)
+        self.lock = threading.Lock()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def settings(self):
+        return self.server.settings
+
+    def _count(self, kind):
+        with self.settings.lock:
+            self.settings.requests[kind] += 1
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.settings.failing:
+            self._send_json({"error": "stub endpoint unavailable"}, status=503)
+        elif self.path == "/api/tags":
+            self._count("tags")
+            models = [m if ":" in m else f"{m}:latest" for m in self.settings.models]
+            self._send_json({"models": [{"name": m, "model": m} for m in models]})
+        elif self.path in ("/", "/api/version"):
+            self._send_json({"version": "stub"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        payload = self._read_json()
+        with self.settings.lock:
+            self.settings.in_flight += 1
+        try:
+            if self.settings.failing:
+                self._send_json({"error": "stub endpoint unavailable"}, status=503)
+            elif self.path == "/api/chat":
+                self._count("chat")
+                self._chat(payload)
+            elif self.path in ("/api/embed", "/api/embeddings"):
+                self._count("embed")
+                self._embed(payload)
+            elif self.path == "/api/pull":
+                self._count("pull")
+                self._stream([{"status": "pulling manifest"}, {"status": "success"}])
+            else:
+                self._send_json({"error": "not found"}, status=404)
+        finally:
+            with self.settings.lock:
+                self.settings.in_flight -= 1
+
+    def _embed(self, payload):
+        time.sleep(self.settings.embed_latency)
+        if self.path == "/api/embeddings":
+            self._send_json({"embedding": stub_embedding(payload.get("prompt", ""))})
+            return
+        inputs = payload.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        self._send_json({"model": payload.get("model"), "embeddings": [stub_embedding(t) for t in inputs]})
+
+    def _stream(self, events, delays=None):
+        """Writes NDJSON events with chunked transfer encoding."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, event in enumerate(events):
+            if delays:
+                time.sleep(delays[i])
+            data = (json.dumps(event) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chat(self, payload):
+        messages = payload.get("messages", [])
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        model = payload.get("model")
+        prompt_tokens = len(prompt.split())
+
+        def message_event(message, done=False, eval_count=0):
+            event = {"model": model, "created_at": "1970-01-01T00:00:00Z", "message": message, "done": done}
+            if done:
+                event.update(done_reason="stop", prompt_eval_count=prompt_tokens, eval_count=eval_count)
+            return event
+
+        if payload.get("tools"):
+            # Structured extraction through tool calling
+            name = payload["tools"][0]["function"]["name"]
+            graph = stub_graph(prompt)
+            events = [message_event(
+                {"role": "assistant", "content": "", "tool_calls": [{"function": {"name": name, "arguments": graph}}]},
+                done=True, eval_count=len(json.dumps(graph).split())
+            )]
+            delays = [self.settings.chat_latency]
+        elif isinstance(payload.get("format"), dict) or payload.get("format") == "json":
+            # Structured extraction through JSON-schema output
+            content = json.dumps(stub_graph(prompt))
+            events = [
+                message_event({"role": "assistant", "content": content}),
+                message_event({"role": "assistant", "content": ""}, done=True, eval_count=len(content.split()))
+            ]
+            delays = [self.settings.chat_latency, 0]
+        else:
+            if "Generate Cypher statement" in prompt:
+                question = prompt.rsplit("The question is:", 1)[-1]
+                terms = _ENTITY.findall(question) or _WORD.findall(question)[-1:] or ["mimir"]
+                tokens = [f'CALL db.index.fulltext.queryNodes("entity_fulltext", "{terms[-1]}") '
+                          f'YIELD node AS n MATCH (n)-[r]-(m) RETURN n, r, m']
+            else:
+                tokens = [f"token{i} " for i in range(self.settings.answer_tokens)]
+            events = [message_event({"role": "assistant", "content": t}) for t in tokens]
+            events.append(message_event({"role": "assistant", "content": ""}, done=True, eval_count=len(tokens)))
+            delays = [self.settings.chat_latency] + [self.settings.token_latency] * (len(events) - 1)
+
+        if payload.get("stream", True):
+            self._stream(events, delays)
+        else:
+            time.sleep(sum(delays))
+            content = "".join(e["message"].get("content", "") for e in events)
+            final = dict(events[-1])
+            final["message"] = dict(events[0]["message"], content=content)
+            self._send_json(final)
+
+class StubOllamaServer:
+    """Runs the stub API on a background thread: `with StubOllamaServer(...) as url:`."""
+    def __init__(self, host="127.0.0.1", port=0, **settings):
+        self.settings = StubSettings(**settings)
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.settings = self.settings
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Deterministic Ollama API stub")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--models", nargs="*", default=["llama3.2", "nomic-embed-text"])
+    parser.add_argument("--chat-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--embed-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    server = StubOllamaServer(
+        port=args.port, models=args.models, chat_latency=args.chat_latency,
+        token_latency=args.token_latency, embed_latency=args.embed_latency
+    )
+    print(f"Stub Ollama listening on {server.start()}")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,145 @@
+# This file is part of Mimir.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Recall and latency of the vector backends on synthetic embeddings.
+Ground truth is brute-force cosine similarity; the local index is measured in
+exact (memmap) and HNSW mode (if hnswlib is installed), and the Neo4j vector
+index too when --neo4j is given (uses the credentials in config.py).
+
+    python -m benchmarks.vector_recall --vectors 50000 --dim 768 --queries 200
+"""
+
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+from benchmarks.run import summarize
+from modules import vector_index
+import config
+
+BENCH_LABEL = "MimirBenchVector"
+BENCH_INDEX = "mimir_bench_vector_index"
+
+def synthetic_vectors(count, dim, queries, seed):
+    """Clustered Gaussian embeddings (closer to real text than uniform noise)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 100), dim)).astype(np.float32)
+    data = centers[rng.integers(len(centers), size=count)] + 0.3 * rng.normal(size=(count, dim)).astype(np.float32)
+    probes = centers[rng.integers(len(centers), size=queries)] + 0.3 * rng.normal(size=(queries, dim)).astype(np.float32)
+    return data, probes
+
+def ground_truth(data, probes, k):
+    normalized = data / np.linalg.norm(data, axis=1, keepdims=True)
+    truth = []
+    for probe in probes:
+        scores = normalized @ (probe / np.linalg.norm(probe))
+        top = np.argpartition(-scores, k - 1)[:k]
+        truth.append({f"v{i}" for i in top})
+    return truth
+
+def measure(search, probes, truth, k):
+    """search(vector, k) -> ids. Returns recall@k and latency percentiles."""
+    latencies, recalls = [], []
+    for probe, expected in zip(probes, truth):
+        start = time.perf_counter()
+        found = search(probe, k)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len(expected & set(found)) / k)
+    return {"recall": sum(recalls) / len(recalls), "latency": summarize(latencies)}
+
+def bench_local(data, probes, truth, k, use_hnsw):
+    with tempfile.TemporaryDirectory() as directory:
+        index = vector_index.LocalVectorIndex(directory, use_hnsw=use_hnsw)
+        ids = [f"v{i}" for i in range(len(data))]
+        start = time.perf_counter()
+        for offset in range(0, len(data), 10_000):
+            batch = slice(offset, offset + 10_000)
+            index.add_embeddings([""] * len(ids[batch]), data[batch], ids=ids[batch])
+        build = time.perf_counter() - start
+
+        # First search maps the file (and builds the HNSW graph); measured separately
+        start = time.perf_counter()
+        index.search(probes[0], k)
+        load = time.perf_counter() - start
+
+        result = measure(lambda v, n: [d.id for d in index.similarity_search_by_vector(v, n)], probes, truth, k)
+        result.update({"backend": "local-hnsw" if index.use_hnsw else "local-exact", "write_seconds": build, "load_seconds": load})
+        return result
+
+def bench_neo4j(data, probes, truth, k):
+    from neo4j import GraphDatabase
+    driver = GraphDatabase.driver(config.NEO4J_URI, auth=(config.NEO4J_USERNAME, config.NEO4J_PASSWORD))
+    try:
+        driver.execute_query(
+            f"CREATE VECTOR INDEX {BENCH_INDEX} IF NOT EXISTS FOR (n:{BENCH_LABEL}) ON (n.embedding) "
+            f"OPTIONS {{indexConfig: {{`vector.dimensions`: {data.shape[1]}, `vector.similarity_function`: 'cosine'}}}}"
+        )
+        start = time.perf_counter()
+        for offset in range(0, len(data), 1000):
+            rows = [{"id": f"v{offset + i}", "embedding": vector.tolist()} for i, vector in enumerate(data[offset:offset + 1000])]
+            driver.execute_query(f"UNWIND $rows AS row CREATE (n:{BENCH_LABEL} {{id: row.id}}) SET n.embedding = row.embedding", rows=rows)
+        driver.execute_query("CALL db.awaitIndexes(600)")
+        build = time.perf_counter() - start
+
+        def search(vector, n):
+            records, _, _ = driver.execute_query(
+                "CALL db.index.vector.queryNodes($index, $k, $vector) YIELD node RETURN node.id AS id",
+                index=BENCH_INDEX, k=n, vector=vector.tolist()
+            )
+            return [record["id"] for record in records]
+
+        result = measure(search, probes, truth, k)
+        result.update({"backend": "neo4j", "write_seconds": build})
+        return result
+    finally:
+        driver.execute_query(
+            f"MATCH (n:{BENCH_LABEL}) CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF 10000 ROWS"
+        )
+        driver.execute_query(f"DROP INDEX {BENCH_INDEX} IF EXISTS")
+        driver.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Mimir vector backend recall/latency benchmark")
+    parser.add_argument("--vectors", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=768, help="nomic-embed-text produces 768 dimensions")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=3, help="Chunks retrieved per question (HybridRAG uses 3)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--neo4j", action="store_true", help="Also benchmark the Neo4j vector index")
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    data, probes = synthetic_vectors(args.vectors, args.dim, args.queries, args.seed)
+    truth = ground_truth(data, probes, args.k)
+
+    results = [bench_local(data, probes, truth, args.k, use_hnsw=False)]
+    if vector_index.hnswlib is not None:
+        results.append(bench_local(data, probes, truth, args.k, use_hnsw=True))
+    if args.neo4j:
+        results.append(bench_neo4j(data, probes, truth, args.k))
+
+    output = json.dumps({"parameters": vars(args), "backends": results}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
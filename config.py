@@ -19,15 +19,104 @@
 NEO4J_URI = "bolt://localhost:7687"
 NEO4J_USERNAME = "neo4j"
 NEO4J_PASSWORD = "password123"
+NEO4J_POOL_SIZE = 16             # Bolt connections shared by the UI, chat engines and ingestion workers
+NEO4J_ACQUISITION_TIMEOUT = 30   # Seconds to wait for a free pooled connection
+NEO4J_CONNECTION_TIMEOUT = 5     # Seconds to open a connection (keeps the sidebar check snappy when Neo4j is down)
+NEO4J_LIVENESS_CHECK = 60        # Idle seconds after which a pooled connection is tested before reuse
 
 # --- OLLAMA MODEL CONFIGURATION ---
 DEFAULT_MODEL = "llama3.2"
 EMBEDDING_MODEL = "nomic-embed-text"
 OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_CHAT_URLS = [OLLAMA_BASE_URL]   # Endpoints for chat and graph extraction (least-loaded routing + failover)
+OLLAMA_EMBED_URLS = [OLLAMA_BASE_URL]  # Endpoints for embeddings, kept apart from chat traffic
+OLLAMA_RETRY_AFTER = 30          # Seconds a failing endpoint is skipped before it is checked again
+MODEL_TAGS_TTL = 30              # Seconds the installed-model list is cached (also the endpoint health check)
 AVAILABLE_MODELS = [
     "llama3.2",      # 3B - Very fast, low VRAM (Best for Ingestion)
     "phi3:mini",     # 3.8B - Smart & Efficient (Microsoft)
     "mistral",       # 7B - Balanced performance
     "llama3.1:8b",   # 8B - Smartest, pushes VRAM limit (Best for Chat)
     "qwen2.5:7b"     # 7B - Great for coding/logic
-]
\ No newline at end of file
+]
+
+# --- INGESTION PERFORMANCE ---
+INGEST_BATCH_SIZE = 64           # Chunks loaded, extracted and embedded per step (bounds memory)
+EXTRACTION_CONCURRENCY = 4       # Parallel graph-extraction requests sent to Ollama
+EXTRACTION_MAX_RETRIES = 2       # Extra attempts per chunk before it is skipped
+EXTRACTION_RETRY_BACKOFF = 2.0   # Seconds, doubled after every failed attempt
+GRAPH_WRITE_BATCH_SIZE = 1000    # Rows per UNWIND transaction when writing the graph
+DELETE_BATCH_SIZE = 1000         # Nodes per transaction when deleting sources or wiping the graph
+
+# --- CHUNKING ---
+# Sizes in tokens (counted with tiktoken, see TOKENIZER_ENCODING). Chunks break at
+# headings, paragraphs and sentences first and never cross page boundaries.
+CHUNK_TOKENS = 512               # Target chunk size
+CHUNK_OVERLAP_TOKENS = 32        # Tokens repeated between consecutive chunks
+EXTRACTION_BATCH_TOKENS = 1536   # Consecutive chunks packed into one extraction request up to this size
+MODEL_CHUNKING = {               # Per-model overrides of the three settings above
+    "phi3:mini": {"chunk_tokens": 384, "extraction_batch_tokens": 1024},
+    "llama3.1:8b": {"chunk_tokens": 1024, "extraction_batch_tokens": 4096},
+    "qwen2.5:7b": {"chunk_tokens": 1024, "extraction_batch_tokens": 4096}
+}
+
+# --- CACHES ---
+CACHE_DIR = ".mimir_cache"
+EXTRACTION_CACHE_ENABLED = True
+EXTRACTION_CACHE_PATH = f"{CACHE_DIR}/extraction.sqlite"
+EXTRACTION_CACHE_MAX_ENTRIES = 200_000   # LRU-evicted beyond this many chunks
+
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = f"{CACHE_DIR}/embeddings.sqlite"
+EMBEDDING_CACHE_MAX_ENTRIES = 500_000
+EMBEDDING_BATCH_SIZE = 64        # Texts per embed_documents request to Ollama
+QUERY_EMBEDDING_CACHE_SIZE = 1024  # In-memory LRU for chat question embeddings
+
+# --- QUERY ENGINE ---
+SCHEMA_REFRESH_TTL = 300         # Seconds before the cached graph schema is re-read
+GRAPH_VERSION_POLL = 5           # Seconds between reads of the graph version stored in Neo4j
+VECTOR_SEARCH_TIMEOUT = 15       # Seconds before the vector leg is dropped from synthesis
+GRAPH_SEARCH_TIMEOUT = 60        # Seconds before the graph (Cypher) leg is dropped
+RETRIEVAL_WORKERS = 8            # Threads running retrieval legs (timed-out legs finish in the background)
+RETRIEVAL_MODE = "expansion"     # "expansion": vector top-k + entity neighbourhood in one Cypher query (no LLM call)
+                                 # "cypher": vector search + LLM-generated Cypher, run side by side
+EXPANSION_HOPS = 1               # Relationship hops walked from the entities the matched chunks mention
+EXPANSION_TRIPLE_LIMIT = 50      # Max relationships returned by the expansion
+EXPANSION_TIMEOUT = 15           # Seconds before the expansion query is dropped
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_SIMILARITY = 0.95   # Cosine similarity for a question to reuse a cached answer
+ANSWER_CACHE_MAX_ENTRIES = 256   # Answers kept per model (LRU)
+ANSWER_CACHE_TTL = 900           # Seconds a cached answer is served (backstop for missed graph changes)
+CYPHER_CACHE_ENABLED = True
+CYPHER_CACHE_MAX_ENTRIES = 2048
+CYPHER_CACHE_HISTORY_PATH = f"{CACHE_DIR}/cypher_history.jsonl"  # Replayed on startup to warm the cache
+
+# --- CONTEXT PACKING ---
+CONTEXT_TOKEN_BUDGET = 1500      # Tokens of retrieved context (chunks + graph facts) sent to synthesis
+MODEL_CONTEXT_TOKEN_BUDGETS = {  # Per-model overrides
+    "phi3:mini": 1200,
+    "llama3.1:8b": 3000,
+    "qwen2.5:7b": 3000
+}
+CONTEXT_VECTOR_SHARE = 0.5       # Budget share reserved for vector chunks (unused share goes to the graph)
+TOKENIZER_ENCODING = "cl100k_base"  # tiktoken encoding used to count tokens (approximates Ollama tokenizers)
+
+# --- ANALYTICS ---
+ANALYTICS_WRITE_BACK = True      # Store PageRank/community results as node properties
+STATS_CACHE_TTL = 60             # Seconds graph statistics and the document list are cached between ingestions
+
+# --- BACKGROUND INGESTION JOBS ---
+JOB_LEDGER_PATH = f"{CACHE_DIR}/jobs.sqlite"
+UPLOAD_DIR = f"{CACHE_DIR}/uploads"   # UI uploads wait here until their job runs
+JOB_WORKERS = 2                  # Documents ingested in parallel
+JOB_POLL_INTERVAL = 2.0          # Seconds idle workers wait before checking the queue again
+JOB_LEASE = 60                   # Seconds a running job stays claimed without a heartbeat from its runner
+
+# --- OBSERVABILITY ---
+METRICS_PORT = 9464              # Prometheus /metrics endpoint (0 disables it)
+
+# --- VECTOR BACKEND ---
+VECTOR_BACKEND = "neo4j"         # "neo4j" (vector_index in the database) or "local" (on-disk index, no Bolt round trip)
+LOCAL_VECTOR_DIR = f"{CACHE_DIR}/vectors"
+LOCAL_VECTOR_HNSW = True         # Approximate search with hnswlib when installed; exact memmap search otherwise
+LOCAL_VECTOR_EF = 64             # HNSW search breadth (higher = better recall, slower)
@@ -0,0 +1,95 @@
+# This file is part of Mimir.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Bulk ingestion from the command line.
+
+    python ingest.py add docs/ paper.pdf https://example.com/page --model llama3.2
+    python ingest.py run --workers 4
+    python ingest.py status
+"""
+
+import argparse
+import os
+from modules import jobs, ingestor, metrics
+import config
+
+def _expand_targets(targets):
+    """Yields (kind, target) for URLs, files and every supported file under directories."""
+    for target in targets:
+        if target.startswith(("http://", "https://")):
+            yield "url", target
+        elif os.path.isdir(target):
+            for root, _, files in os.walk(target):
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in ingestor.SUPPORTED_EXTENSIONS:
+                        yield "file", os.path.abspath(os.path.join(root, name))
+        elif os.path.isfile(target):
+            yield "file", os.path.abspath(target)
+        else:
+            print(f"⚠️ Skipping {target}: not a file, directory or URL")
+
+def cmd_add(args, ledger):
+    count = 0
+    for kind, target in _expand_targets(args.targets):
+        ledger.enqueue(kind, target, args.model)
+        count += 1
+    print(f"📥 Queued {count} job(s)")
+
+def cmd_run(args, ledger):
+    if args.retry_failed:
+        print(f"🔁 Re-queued {ledger.retry_failed()} failed job(s)")
+    metrics.start_metrics_server()
+    jobs.JobRunner(ledger, workers=args.workers, exit_when_idle=True).start().join()
+    cmd_status(args, ledger)
+
+def cmd_status(args, ledger):
+    counts = ledger.counts()
+    print(" · ".join(f"{status}: {n}" for status, n in counts.items()))
+    for job in ledger.list_jobs(limit=args.limit):
+        line = f"#{job['id']:<6} {job['status']:<8} {job['source_name']}"
+        if job["error"]:
+            line += f"  ({job['error']})"
+        print(line)
+        if job["result"] and job["result"].get("timings"):
+            print(f"        {metrics.format_breakdown(job['result']['timings'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Mimir bulk ingestion")
+    parser.add_argument("--ledger", default=config.JOB_LEDGER_PATH, help="Path of the job ledger database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add = subparsers.add_parser("add", help="Queue files, directories or URLs")
+    add.add_argument("targets", nargs="+")
+    add.add_argument("--model", default=config.DEFAULT_MODEL)
+    add.set_defaults(func=cmd_add)
+
+    run = subparsers.add_parser("run", help="Process queued jobs (resumes interrupted ones) and exit when done")
+    run.add_argument("--workers", type=int, default=config.JOB_WORKERS)
+    run.add_argument("--retry-failed", action="store_true")
+    run.add_argument("--limit", type=int, default=20)
+    run.set_defaults(func=cmd_run)
+
+    status = subparsers.add_parser("status", help="Show job counts and the most recent jobs")
+    status.add_argument("--limit", type=int, default=20)
+    status.set_defaults(func=cmd_status)
+
+    args = parser.parse_args()
+    args.func(args, jobs.JobLedger(args.ledger))
+
+if __name__ == "__main__":
+    main()
@@ -18,8 +18,9 @@
 import streamlit as st
 from streamlit_option_menu import option_menu
 import os
-import tempfile
-from modules import database, ingestor, rag_engine, llm, analytics
+import shutil
+import uuid
+from modules import database, jobs, rag_engine, llm, analytics, metrics
 import config
 
 # --- VISUAL CONFIGURATION ---
@@ -30,7 +31,65 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+def progress_reporter(label):
+    """Returns a progress(done, total) callback backed by an st.progress bar."""
+    bar = st.progress(0.0, text=label)
+    def report(done, total):
+        bar.progress(done / total if total else 1.0, text=f"{label} {done}/{total}")
+    return report
+
+def clear_database_when_idle():
+    """Wipes Neo4j before a new ingestion, refusing while background jobs are still writing to it."""
+    running = jobs.get_ledger().counts()["running"]
+    if running:
+        raise RuntimeError(f"{running} ingestion job(s) still running; wait for them to finish before clearing the database")
+    database.clear_database(database.get_graph_db(), progress=progress_reporter("🧹 Wiping Neo4j database..."))
+
+@st.fragment(run_every=config.JOB_POLL_INTERVAL)
+def render_jobs_panel():
+    """Ingestion progress, re-polled from the job ledger without rerunning the page."""
+    ledger = jobs.get_ledger()
+    counts = ledger.counts()
+
+    st.markdown("### ⚙️ Ingestion Jobs")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Queued", counts["queued"])
+    col2.metric("Running", counts["running"])
+    col3.metric("Done", counts["done"])
+    col4.metric("Failed", counts["failed"])
+
+    if counts["queued"] or counts["running"]:
+        # Resume work left over from a previous session
+        jobs.ensure_background_runner()
+
+    rows = []
+    for job in ledger.list_jobs(limit=50):
+        result = job["result"] or {}
+        graph_write = result.get("graph_write") or {}
+        rows.append({
+            "Job": job["id"],
+            "Source": os.path.basename(job["source_name"]) if job["kind"] == "file" else job["source_name"],
+            "Status": job["status"],
+            "Time (s)": round(result["duration"], 2) if "duration" in result else None,
+            "Chunks": result.get("pages"),
+            "New": result.get("new_chunks"),
+            "Removed": result.get("removed_chunks"),
+            "Entities": result.get("entities"),
+            "Failed chunks": len(result.get("failed_chunks", [])) if result else None,
+            "Graph rows/s": round(graph_write["rows_per_sec"]) if graph_write else None,
+            "Breakdown": metrics.format_breakdown(result["timings"]) if result.get("timings") else None,
+            "Error": job["error"]
+        })
+
+    if rows:
+        st.dataframe(rows, width='stretch', hide_index=True)
+    else:
+        st.caption("No ingestion jobs yet.")
+
 def main():
+    # Prometheus endpoint (started once per process)
+    metrics.start_metrics_server()
+
     # 1. SIDEBAR
     with st.sidebar:
         st.header("🧙🏻‍♂️ Mimir")
@@ -69,14 +128,28 @@ def main():
             st.caption(f"🟢 **{selected_model}** ready")
         else:
             st.caption(f"🟠 **{selected_model}** will download on use")
+            if st.button("Download now", use_container_width=True):
+                progress = st.progress(0.0, text="Starting download...")
+                try:
+                    for event in llm.pull_model(selected_model):
+                        if event.get("total"):
+                            progress.progress(
+                                min(event.get("completed", 0) / event["total"], 1.0),
+                                text=event.get("status", "")
+                            )
+                        else:
+                            progress.progress(0.0, text=event.get("status", ""))
+                except Exception as e:
+                    st.error(f"Download failed: {e}")
+                else:
+                    st.rerun()
 
         st.markdown("---")
 
         # Database Status & Link
-        try:
-            database.get_graph_db()
+        if database.ping():
             st.caption("🟢 Neo4j Online · [Open Browser](http://localhost:7474)")
-        except:
+        else:
             st.error("🔴 Neo4j Disconnected")
 
     # 2. VIEW: CHAT INTERFACE
@@ -99,41 +172,41 @@ def main():
 
             with st.chat_message("assistant"):
                 placeholder = st.empty()
-                with st.spinner(f"{selected_model} is thinking..."):
-                    try:
-                        graph = database.get_graph_db()
-                        graph.refresh_schema()
-
-                        # Initialize Hybrid RAG
-                        rag = rag_engine.get_qa_chain(graph, model_name=selected_model)
-                        response_data = rag.query(prompt)
-
-                        answer_text = response_data["answer"]
-                        sources = response_data["sources"]
-
-                        # 1. Render the main answer
-                        placeholder.markdown(answer_text)
-
-                        # 2. Render sources
-                        if sources:
-                            with st.expander("📚 Reference Sources"):
-                                for i, doc in enumerate(sources):
-                                    # Clean up filename
-                                    source_name = os.path.basename(doc.get('source', 'Unknown'))
-                                    page = doc.get('page', 'N/A')
-                                    # Preview content (first 250 chars)
-                                    content_preview = doc.get('content', '')[:250].replace('\n', ' ')
-
-                                    st.markdown(f"**{i+1}. {source_name}** (Page {page})")
-                                    st.caption(f"_{content_preview}..._")
-                                    if i < len(sources) - 1:
-                                        st.divider()
-
-                        # 3. Save only text to history to keep context clean
-                        st.session_state.messages.append({"role": "assistant", "content": answer_text})
-
-                    except Exception as e:
-                        placeholder.error(f"Error: {e}")
+                try:
+                    # Reuse the long-lived Hybrid RAG engine for this model
+                    with st.spinner(f"{selected_model} is thinking..."):
+                        rag = rag_engine.get_qa_chain(model_name=selected_model)
+                        stream = rag.stream_query(prompt)
+
+                    # 1. Render the main answer token by token
+                    placeholder.write_stream(stream)
+                    sources = stream.sources
+                    caption = metrics.format_breakdown(stream.timings)
+                    if stream.context:
+                        caption += (f" · prompt {stream.context['prompt_tokens']} tokens"
+                                    f" (unpacked {stream.context['raw_prompt_tokens']})")
+                    st.caption(caption)
+
+                    # 2. Render sources
+                    if sources:
+                        with st.expander("📚 Reference Sources"):
+                            for i, doc in enumerate(sources):
+                                # Clean up filename
+                                source_name = os.path.basename(doc.get('source', 'Unknown'))
+                                page = doc.get('page', 'N/A')
+                                # Preview content (first 250 chars)
+                                content_preview = doc.get('content', '')[:250].replace('\n', ' ')
+
+                                st.markdown(f"**{i+1}. {source_name}** (Page {page})")
+                                st.caption(f"_{content_preview}..._")
+                                if i < len(sources) - 1:
+                                    st.divider()
+
+                    # 3. Save only text to history to keep context clean
+                    st.session_state.messages.append({"role": "assistant", "content": stream.answer})
+
+                except Exception as e:
+                    placeholder.error(f"Error: {e}")
 
 # 3. VIEW: DOCUMENT MANAGEMENT
     elif view == "Ingest":
@@ -142,77 +215,81 @@ def main():
         with st.expander("⚙️ Advanced Settings"):
             clear_db = st.toggle("Clear existing database before ingestion")
 
+            st.markdown("**Remove a document**")
+            try:
+                sources = database.list_sources(database.get_graph_db())
+            except Exception as e:
+                sources = []
+                st.error(f"Could not list documents: {e}")
+
+            if sources:
+                col_source, col_button = st.columns([3, 1])
+                source_to_delete = col_source.selectbox(
+                    "Document",
+                    [row["source"] for row in sources],
+                    format_func=lambda source: os.path.basename(source) or source,
+                    label_visibility="collapsed"
+                )
+                if col_button.button("Delete", use_container_width=True):
+                    try:
+                        deleted = database.delete_source(
+                            database.get_graph_db(), source_to_delete,
+                            progress=progress_reporter("🗑️ Deleting chunks...")
+                        )
+                        st.success(f"Removed {deleted} chunks of {source_to_delete}")
+                    except Exception as e:
+                        st.error(f"Error: {e}")
+            else:
+                st.caption("No documents ingested yet.")
+
         tab_file, tab_url = st.tabs(["📄 File Upload", "🌐 Web URL"])
 
         # --- TAB 1: ARCHIVOS ---
         with tab_file:
-            uploaded_file = st.file_uploader(
+            uploaded_files = st.file_uploader(
                 "Upload documents",
                 type=["pdf", "docx", "txt", "md"],
+                accept_multiple_files=True,
                 label_visibility="collapsed"
             )
 
-            if uploaded_file and st.button("Process Document", type="primary", use_container_width=True):
-                graph = database.get_graph_db()
+            if uploaded_files and st.button("Queue Documents", type="primary", use_container_width=True):
+                try:
+                    if clear_db:
+                        clear_database_when_idle()
 
-                with st.status("Running File Ingestion Pipeline...", expanded=True) as status:
-                    try:
-                        st.write("📂 Saving temporary file...")
+                    # Uploads are kept on disk until their background job has ingested them
+                    os.makedirs(config.UPLOAD_DIR, exist_ok=True)
+                    ledger = jobs.get_ledger()
+                    for uploaded_file in uploaded_files:
                         ext = os.path.splitext(uploaded_file.name)[1]
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-                            tmp.write(uploaded_file.read())
-                            tmp_path = tmp.name
-
-                        if clear_db:
-                            st.write("🧹 Wiping Neo4j database...")
-                            database.clear_database(graph)
-
-                        st.write(f"🧠 Extracting Graph & Vectors using {selected_model}...")
-                        stats = ingestor.process_file(tmp_path, graph, model_name=selected_model, original_filename=uploaded_file.name)
+                        upload_path = os.path.join(config.UPLOAD_DIR, f"{uuid.uuid4().hex}{ext}")
+                        with open(upload_path, "wb") as f:
+                            shutil.copyfileobj(uploaded_file, f)
+                        ledger.enqueue("file", upload_path, selected_model, source_name=uploaded_file.name, cleanup=True)
 
-                        os.remove(tmp_path)
-                        status.update(label="✅ Ingestion Complete!", state="complete", expanded=False)
-
-                        st.divider()
-                        col1, col2, col3 = st.columns(3)
-                        col1.metric("Time", f"{stats['duration']:.2f}s")
-                        col2.metric("Chunks", stats['pages'])
-                        col3.metric("Entities", stats['entities'])
-
-                    except Exception as e:
-                        status.update(label="❌ Ingestion Failed", state="error")
-                        st.error(f"Error: {e}")
+                    jobs.ensure_background_runner()
+                    st.toast(f"📥 Queued {len(uploaded_files)} document(s) for ingestion")
+                except Exception as e:
+                    st.error(f"Error: {e}")
 
         # --- TAB 2: URLS ---
         with tab_url:
             target_url = st.text_input("Enter URL", placeholder="https://en.wikipedia.org/wiki/Graph_database")
 
-            if target_url and st.button("Process URL", type="primary", use_container_width=True):
-                graph = database.get_graph_db()
+            if target_url and st.button("Queue URL", type="primary", use_container_width=True):
+                try:
+                    if clear_db:
+                        clear_database_when_idle()
 
-                with st.status("Running Web Ingestion Pipeline...", expanded=True) as status:
-                    try:
-                        st.write(f"🌐 Fetching content from {target_url}...")
-
-                        if clear_db:
-                            st.write("🧹 Wiping Neo4j database...")
-                            database.clear_database(graph)
-
-                        st.write(f"🧠 Extracting Graph & Vectors using {selected_model}...")
-
-                        stats = ingestor.process_url(target_url, graph, model_name=selected_model)
+                    jobs.get_ledger().enqueue("url", target_url, selected_model)
+                    jobs.ensure_background_runner()
+                    st.toast(f"📥 Queued {target_url} for ingestion")
+                except Exception as e:
+                    st.error(f"Error: {e}")
 
-                        status.update(label="✅ Ingestion Complete!", state="complete", expanded=False)
-
-                        st.divider()
-                        col1, col2, col3 = st.columns(3)
-                        col1.metric("Time", f"{stats['duration']:.2f}s")
-                        col2.metric("Chunks", stats['pages'])
-                        col3.metric("Entities", stats['entities'])
-
-                    except Exception as e:
-                        status.update(label="❌ Ingestion Failed", state="error")
-                        st.error(f"Error: {e}")
+        st.divider()
+        render_jobs_panel()
 
     # 4. VIEW: ANALYTICS
     elif view == "Analytics":
@@ -225,9 +302,24 @@ def main():
 
             # A. General Stats
             stats = analytics.get_stats(graph)
-            col1, col2 = st.columns(2)
+            col1, col2, col3, col4 = st.columns(4)
             col1.metric("Total Nodes", stats['nodes'])
             col2.metric("Total Relationships", stats['edges'])
+            col3.metric("Entities", stats['entities'])
+            col4.metric("Chunks", stats['chunks'])
+
+            with st.expander("📊 Breakdown"):
+                col_labels, col_types = st.columns(2)
+                col_labels.dataframe(
+                    [{"Label": k, "Nodes": v} for k, v in sorted(stats['labels'].items(), key=lambda x: -x[1])],
+                    width='stretch', hide_index=True
+                )
+                col_types.dataframe(
+                    [{"Relationship": k, "Count": v} for k, v in sorted(stats['relationship_types'].items(), key=lambda x: -x[1])],
+                    width='stretch', hide_index=True
+                )
+                if stats['indexes']:
+                    st.dataframe(stats['indexes'], width='stretch', hide_index=True)
 
             st.divider()
 
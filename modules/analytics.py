@@ -15,94 +15,208 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import threading
+import time
 import pandas as pd
+from modules import database
+import config
+
+_stats_cache = {"key": None, "at": 0.0, "value": None}
+_stats_lock = threading.Lock()
+
+def _count_store_breakdown(graph_db):
+    """Per-label and per-relationship-type counts, read from the count store."""
+    try:
+        stats = graph_db.query(
+            "CALL apoc.meta.stats() YIELD labels, relTypesCount RETURN labels, relTypesCount"
+        )[0]
+        return stats["labels"], stats["relTypesCount"]
+    except Exception:
+        # Without APOC: one count-store lookup per label / type
+        labels = {}
+        for row in graph_db.query("CALL db.labels() YIELD label RETURN label"):
+            name = row["label"].replace("`", "")
+            labels[row["label"]] = graph_db.query(f"MATCH (n:`{name}`) RETURN count(n) AS c")[0]["c"]
+        rel_types = {}
+        for row in graph_db.query("CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType"):
+            name = row["relationshipType"].replace("`", "")
+            rel_types[row["relationshipType"]] = graph_db.query(f"MATCH ()-[r:`{name}`]->() RETURN count(r) AS c")[0]["c"]
+        return labels, rel_types
+
+def _collect_stats(graph_db):
+    totals = graph_db.query("""
+    CALL { MATCH (n) RETURN count(n) AS nodes }
+    CALL { MATCH ()-[r]->() RETURN count(r) AS edges }
+    RETURN nodes, edges
+    """)[0]
+    labels, rel_types = _count_store_breakdown(graph_db)
+
+    indexes = []
+    for row in graph_db.query("""
+    SHOW INDEXES YIELD name, type, entityType, labelsOrTypes, properties, state
+    WHERE type <> 'LOOKUP'
+    RETURN name, type, entityType, labelsOrTypes, properties, state
+    """):
+        # Entries ~ number of nodes/relationships carrying the indexed label/type
+        counts = labels if row["entityType"] == "NODE" else rel_types
+        indexes.append({
+            "name": row["name"],
+            "type": row["type"],
+            "on": ", ".join(row["labelsOrTypes"] or []),
+            "properties": ", ".join(row["properties"] or []),
+            "state": row["state"],
+            "entries": sum(counts.get(label, 0) for label in row["labelsOrTypes"] or [])
+        })
+
+    return {
+        "nodes": totals["nodes"],
+        "edges": totals["edges"],
+        "chunks": labels.get("Chunk", 0),
+        "entities": labels.get(database.ENTITY_LABEL, 0),
+        "labels": labels,
+        "relationship_types": rel_types,
+        "indexes": indexes
+    }
 
 def get_stats(graph_db):
-    """Returns basic graph statistics (node and edge counts)."""
-    query = """
-    MATCH (n)
-    OPTIONAL MATCH (n)-[r]->()
-    RETURN count(DISTINCT n) as nodes, count(r) as edges
     """
-    data = graph_db.query(query)
-    return data[0]
+    Returns graph statistics (totals, chunk vs entity counts, per-label and
+    per-type breakdowns, indexes) from O(1) count-store queries.
+    Cached until ingestion changes the graph or STATS_CACHE_TTL expires.
+    """
+    with _stats_lock:
+        key = database.get_graph_version(graph_db)
+        fresh = time.time() - _stats_cache["at"] < config.STATS_CACHE_TTL
+        if _stats_cache["value"] is not None and _stats_cache["key"] == key and fresh:
+            return _stats_cache["value"]
+
+        _stats_cache.update(key=key, at=time.time(), value=_collect_stats(graph_db))
+        return _stats_cache["value"]
+
+class ProjectionManager:
+    """
+    Keeps one GDS in-memory projection of the entity graph (Chunk nodes excluded)
+    alive between analytics runs. It is re-projected only when the graph version
+    changes; the key also includes the count-store node and relationship totals,
+    which catch writes made outside Mimir.
+    """
+    def __init__(self, name="mimir_entities"):
+        self.name = name
+        self._key = None
+        self._computed = set()
+        self._lock = threading.Lock()
+
+    def _current_key(self, graph_db):
+        counts = graph_db.query("""
+        CALL { MATCH (n) RETURN count(n) AS nodes }
+        CALL { MATCH ()-[r]->() RETURN count(r) AS edges }
+        RETURN nodes, edges
+        """)[0]
+        return (database.get_graph_version(graph_db), counts["nodes"], counts["edges"])
+
+    def _exists(self, graph_db):
+        result = graph_db.query("CALL gds.graph.exists($name) YIELD exists", {"name": self.name})
+        return bool(result and result[0]["exists"])
+
+    def ensure(self, graph_db):
+        """Projects the entity graph if it is missing or stale. Returns the projection name."""
+        with self._lock:
+            key = self._current_key(graph_db)
+            if key == self._key and self._exists(graph_db):
+                return self.name
+
+            # 1. Clean up the outdated projection
+            graph_db.query("CALL gds.graph.drop($name, false) YIELD graphName", {"name": self.name})
+
+            # 2. Project only entities and the relationships between them
+            graph_db.query(
+                f"CALL gds.graph.project($name, '{database.ENTITY_LABEL}', '*')",
+                {"name": self.name}
+            )
+            self._key = key
+            self._computed = set()
+            return self.name
+
+    def run_once(self, graph_db, algorithm, write_query):
+        """Runs a write-back algorithm unless it already ran on this projection."""
+        self.ensure(graph_db)
+        with self._lock:
+            if algorithm in self._computed:
+                return
+            graph_db.query(write_query, {"name": self.name})
+            self._computed.add(algorithm)
+
+projections = ProjectionManager()
 
 def run_pagerank(graph_db, limit=10):
     """
     Executes PageRank to find the most influential entities in the graph.
+    With write-back enabled scores are stored as node properties and later
+    runs on an unchanged graph only read them.
     """
-    graph_name = "mimir_projection"
-
-    # 1. Clean up previous projection if it exists (safeguard)
     try:
-        graph_db.query(f"CALL gds.graph.drop('{graph_name}', false) YIELD graphName")
-    except:
-        pass
-
-    try:
-        # 2. Create In-Memory Projection (Required by GDS)
-        # We project everything to analyze the full structure
-        graph_db.query(f"""
-        CALL gds.graph.project(
-            '{graph_name}',
-            '*',
-            '*'
-        )
-        """)
-
-        # 3. Execute PageRank Stream
-        # We filter out 'Chunk' nodes to focus on Concepts/Entities
-        query = f"""
-        CALL gds.pageRank.stream('{graph_name}')
-        YIELD nodeId, score
-        WITH gds.util.asNode(nodeId) AS node, score
-        WHERE NOT 'Chunk' IN labels(node) AND node.id IS NOT NULL
-        RETURN node.id AS Entity, score AS Score
-        ORDER BY Score DESC
-        LIMIT {limit}
-        """
+        if config.ANALYTICS_WRITE_BACK:
+            projections.run_once(
+                graph_db, "pagerank",
+                "CALL gds.pageRank.write($name, {writeProperty: 'pagerank'}) YIELD nodePropertiesWritten"
+            )
+            query = f"""
+            MATCH (node:{database.ENTITY_LABEL})
+            WHERE node.pagerank IS NOT NULL AND node.id IS NOT NULL
+            RETURN node.id AS Entity, node.pagerank AS Score
+            ORDER BY Score DESC
+            LIMIT {limit}
+            """
+        else:
+            projections.ensure(graph_db)
+            query = f"""
+            CALL gds.pageRank.stream('{projections.name}')
+            YIELD nodeId, score
+            WITH gds.util.asNode(nodeId) AS node, score
+            WHERE node.id IS NOT NULL
+            RETURN node.id AS Entity, score AS Score
+            ORDER BY Score DESC
+            LIMIT {limit}
+            """
         result = graph_db.query(query)
-
-        # 4. Cleanup
-        graph_db.query(f"CALL gds.graph.drop('{graph_name}', false) YIELD graphName")
-
         return pd.DataFrame(result)
 
     except Exception as e:
         print(f"GDS Error: {e}")
-        # Cleanup in case of error
-        try: graph_db.query(f"CALL gds.graph.drop('{graph_name}', false) YIELD graphName")
-        except: pass
         return pd.DataFrame()
 
 def run_community_detection(graph_db):
     """
     Executes Louvain algorithm to detect communities (clustered topics).
+    Shares the entity projection with PageRank.
     """
-    graph_name = "mimir_community"
-
     try:
-        graph_db.query(f"CALL gds.graph.drop('{graph_name}', false) YIELD graphName")
-
-        # Only projecting Entity-to-Entity relationships for cleaner topics
-        graph_db.query(f"CALL gds.graph.project('{graph_name}', '*', '*')")
-
-        query = f"""
-        CALL gds.louvain.stream('{graph_name}')
-        YIELD nodeId, communityId
-        WITH gds.util.asNode(nodeId) AS node, communityId
-        WHERE NOT 'Chunk' IN labels(node) AND node.id IS NOT NULL
-        RETURN communityId as Community, count(node) as Members, collect(node.id)[..5] as Examples
-        ORDER BY Members DESC
-        LIMIT 10
-        """
+        if config.ANALYTICS_WRITE_BACK:
+            projections.run_once(
+                graph_db, "louvain",
+                "CALL gds.louvain.write($name, {writeProperty: 'community'}) YIELD communityCount"
+            )
+            query = f"""
+            MATCH (node:{database.ENTITY_LABEL})
+            WHERE node.community IS NOT NULL AND node.id IS NOT NULL
+            RETURN node.community AS Community, count(node) AS Members, collect(node.id)[..5] AS Examples
+            ORDER BY Members DESC
+            LIMIT 10
+            """
+        else:
+            projections.ensure(graph_db)
+            query = f"""
+            CALL gds.louvain.stream('{projections.name}')
+            YIELD nodeId, communityId
+            WITH gds.util.asNode(nodeId) AS node, communityId
+            WHERE node.id IS NOT NULL
+            RETURN communityId as Community, count(node) as Members, collect(node.id)[..5] as Examples
+            ORDER BY Members DESC
+            LIMIT 10
+            """
         result = graph_db.query(query)
-
-        graph_db.query(f"CALL gds.graph.drop('{graph_name}', false) YIELD graphName")
-
         return pd.DataFrame(result)
+
     except Exception as e:
         print(f"GDS Error: {e}")
-        try: graph_db.query(f"CALL gds.graph.drop('{graph_name}', false) YIELD graphName")
-        except: pass
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame()
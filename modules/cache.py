@@ -0,0 +1,408 @@
+# This file is part of Mimir.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+import config
+
+def content_hash(*parts):
+    """Stable SHA-256 over the given string parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+class DiskCache:
+    """
+    SQLite-backed key/value store with LRU eviction.
+    Safe to share between threads and processes (UI, ingest CLI, job workers):
+    writes take the SQLite write lock and size eviction on the table's real row count.
+    Values are raw bytes.
+    """
+    def __init__(self, path, max_entries):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, last_access) VALUES (?, ?, ?)",
+                (key, sqlite3.Binary(value), time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def get_many(self, keys):
+        """Returns {key: value} for the keys that are cached."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE cache SET last_access = ? WHERE key = ?", [(now, k) for k in found])
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items):
+        """Stores every (key, value) pair of the given dict in one transaction."""
+        if not items:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, last_access) VALUES (?, ?, ?)",
+                [(k, sqlite3.Binary(v), now) for k, v in items.items()]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """
+        Drops the least recently used entries beyond max_entries. Runs inside the write
+        transaction (lock held), so the count includes rows written by other processes.
+        """
+        excess = self._conn.execute("SELECT count(*) FROM cache").fetchone()[0] - self.max_entries
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access LIMIT ?)",
+            (excess,)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT count(*) FROM cache").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+# --- GRAPH EXTRACTION CACHE ---
+
+def _node_to_dict(node):
+    return {"id": node.id, "type": node.type, "properties": node.properties}
+
+def _node_from_dict(data):
+    return Node(id=data["id"], type=data["type"], properties=data.get("properties", {}))
+
+class ExtractionCache(DiskCache):
+    """
+    Persists LLMGraphTransformer output per chunk.
+    Keys combine the chunk text with the extraction fingerprint (model + prompt/schema),
+    so switching models or prompts never returns stale graphs.
+    """
+    @staticmethod
+    def fingerprint(llm_transformer, model_name, batch_tokens=None):
+        """
+        Identifies everything besides the chunk text that shapes the extracted graph,
+        including the extraction batch size (chunks packed together see each other).
+        """
+        chain = getattr(llm_transformer, "chain", None)
+        prompt = getattr(chain, "first", chain)
+        return content_hash(
+            model_name,
+            repr(prompt),
+            batch_tokens,
+            getattr(llm_transformer, "allowed_nodes", None),
+            getattr(llm_transformer, "allowed_relationships", None),
+            getattr(llm_transformer, "_function_call", None)
+        )
+
+    def get_graph(self, chunk, fingerprint):
+        raw = self.get(content_hash(fingerprint, chunk.page_content))
+        if raw is None:
+            return None
+
+        data = json.loads(raw)
+        return GraphDocument(
+            nodes=[_node_from_dict(n) for n in data["nodes"]],
+            relationships=[
+                Relationship(
+                    source=_node_from_dict(r["source"]),
+                    target=_node_from_dict(r["target"]),
+                    type=r["type"],
+                    properties=r.get("properties", {})
+                )
+                for r in data["relationships"]
+            ],
+            source=chunk
+        )
+
+    def set_graph(self, chunk, fingerprint, graph_document):
+        data = {
+            "nodes": [_node_to_dict(n) for n in graph_document.nodes],
+            "relationships": [
+                {
+                    "source": _node_to_dict(r.source),
+                    "target": _node_to_dict(r.target),
+                    "type": r.type,
+                    "properties": r.properties
+                }
+                for r in graph_document.relationships
+            ]
+        }
+        self.set(content_hash(fingerprint, chunk.page_content), json.dumps(data).encode("utf-8"))
+
+# --- EMBEDDING CACHE ---
+
+class EmbeddingCache(DiskCache):
+    """Persists embedding vectors as packed float32 arrays, keyed by model and text."""
+    def __init__(self, path, max_entries, model_name):
+        super().__init__(path, max_entries)
+        self.model_name = model_name
+
+    def key(self, text):
+        return content_hash(self.model_name, text)
+
+    def get_vectors(self, texts):
+        """Returns {text: vector} for the cached texts."""
+        keys = {self.key(t): t for t in texts}
+        return {keys[k]: array("f", raw).tolist() for k, raw in self.get_many(keys).items()}
+
+    def set_vectors(self, vectors):
+        self.set_many({self.key(t): array("f", v).tobytes() for t, v in vectors.items()})
+
+# --- SEMANTIC ANSWER CACHE ---
+
+def _normalize(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of chat answers, looked up by question embedding.
+    A hit is any stored question whose cosine similarity reaches the threshold.
+    Each model has its own namespace, bounded with LRU eviction; answers older
+    than ttl seconds are never served.
+    """
+    def __init__(self, threshold, max_entries, ttl=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._namespaces = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def sync(self, version):
+        """Drops every answer once the graph version moves (new ingestion or wipe)."""
+        with self._lock:
+            if version != self._version:
+                self._namespaces.clear()
+                self._version = version
+
+    def lookup(self, namespace, embedding):
+        query = _normalize(embedding)
+        with self._lock:
+            entries = self._namespaces.get(namespace, OrderedDict())
+            if self.ttl is not None:
+                expired = time.time() - self.ttl
+                for key in [k for k, (_, _, stored_at) in entries.items() if stored_at < expired]:
+                    del entries[key]
+            best_key, best_score = None, self.threshold
+            for key, (vector, _, _) in entries.items():
+                score = sum(a * b for a, b in zip(query, vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(best_key)
+            self.hits += 1
+            return entries[best_key][1]
+
+    def store(self, namespace, question, embedding, value):
+        with self._lock:
+            entries = self._namespaces.setdefault(namespace, OrderedDict())
+            entries[question] = (_normalize(embedding), value, time.time())
+            entries.move_to_end(question)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._namespaces.clear()
+
+    def stats(self):
+        return {
+            "entries": sum(len(e) for e in self._namespaces.values()),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+# --- CYPHER GENERATION CACHE ---
+
+def normalize_question(question):
+    """Lowercases, collapses whitespace and drops trailing punctuation."""
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+class CypherCache:
+    """
+    In-memory LRU of LLM-generated Cypher, keyed by normalized question, model and schema hash.
+    Only queries that executed without error are stored. New queries are appended to a
+    JSONL history file (discarded ones as tombstones), which is replayed on startup to
+    warm the cache and rewritten to the surviving entries whenever it grows past
+    twice max_entries lines.
+    """
+    def __init__(self, max_entries, history_path=None):
+        self.max_entries = max_entries
+        self.history_path = history_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> (cypher, question)
+        self._history_lines = 0
+        self._lock = threading.Lock()
+        if history_path:
+            self.warm(history_path)
+
+    @staticmethod
+    def key(question, model_name, schema):
+        return content_hash(normalize_question(question), model_name, content_hash(schema))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _put(self, key, cypher, question):
+        self._entries[key] = (cypher, question)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _append(self, record):
+        directory = os.path.dirname(self.history_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.history_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        self._history_lines += 1
+        if self._history_lines > 2 * self.max_entries:
+            self._compact()
+
+    def _compact(self):
+        """Rewrites the history file with one line per cached entry (LRU order)."""
+        temp_path = f"{self.history_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for key, (cypher, question) in self._entries.items():
+                f.write(json.dumps({"key": key, "question": question, "cypher": cypher}) + "\n")
+        os.replace(temp_path, self.history_path)
+        self._history_lines = len(self._entries)
+
+    def store(self, key, cypher, question=None):
+        with self._lock:
+            unchanged = self._entries.get(key, (None,))[0] == cypher
+            self._put(key, cypher, question)
+            if self.history_path and not unchanged:
+                self._append({"key": key, "question": question, "cypher": cypher})
+
+    def discard(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None and self.history_path:
+                self._append({"key": key, "discarded": True})
+
+    def warm(self, history_path):
+        """
+        Loads previously successful queries from a JSONL history file (later lines
+        win, tombstones remove) and compacts the file to what was loaded.
+        """
+        if not os.path.exists(history_path):
+            return 0
+        with self._lock:
+            with open(history_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        if record.get("discarded"):
+                            self._entries.pop(record["key"], None)
+                        else:
+                            self._put(record["key"], record["cypher"], record.get("question"))
+                    except (ValueError, KeyError, AttributeError):
+                        continue
+            if history_path == self.history_path:
+                self._compact()
+            return len(self._entries)
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+_extraction_cache = None
+_extraction_cache_lock = threading.Lock()
+
+def get_extraction_cache():
+    """Returns the process-wide extraction cache, or None when disabled."""
+    global _extraction_cache
+    if not config.EXTRACTION_CACHE_ENABLED:
+        return None
+    with _extraction_cache_lock:
+        if _extraction_cache is None:
+            _extraction_cache = ExtractionCache(config.EXTRACTION_CACHE_PATH, config.EXTRACTION_CACHE_MAX_ENTRIES)
+        return _extraction_cache
@@ -0,0 +1,178 @@
+# This file is part of Mimir.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import math
+import re
+import threading
+import config
+
+_encoder = None
+_encoder_loaded = False
+_encoder_lock = threading.Lock()
+
+def _get_encoder():
+    """tiktoken encoding, or None when it cannot be loaded (e.g. offline without a cached BPE file)."""
+    global _encoder, _encoder_loaded
+    with _encoder_lock:
+        if not _encoder_loaded:
+            try:
+                import tiktoken
+                _encoder = tiktoken.get_encoding(config.TOKENIZER_ENCODING)
+            except Exception as e:
+                print(f"⚠️ Warning: tiktoken encoding unavailable ({type(e).__name__}), estimating tokens from characters")
+            _encoder_loaded = True
+        return _encoder
+
+def count_tokens(text):
+    """Token count of text (tiktoken, which approximates the Ollama models' own tokenizers)."""
+    encoder = _get_encoder()
+    if encoder is None:
+        return math.ceil(len(text) / 4)
+    return len(encoder.encode(text, disallowed_special=()))
+
+def truncate_tokens(text, max_tokens):
+    encoder = _get_encoder()
+    if encoder is None:
+        return text[:max_tokens * 4]
+    return encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens])
+
+def context_budget(model_name):
+    """Tokens of retrieved context the model gets for synthesis."""
+    return config.MODEL_CONTEXT_TOKEN_BUDGETS.get(model_name, config.CONTEXT_TOKEN_BUDGET)
+
+# --- GRAPH ROW RENDERING ---
+
+def _is_vector(key, value):
+    return key == "embedding" or (isinstance(value, list) and len(value) > 16 and all(isinstance(v, float) for v in value[:16]))
+
+def _node_name(value):
+    if isinstance(value, dict):
+        return str(value.get("id") or value.get("name") or _render_value(value))
+    return str(value)
+
+def _render_value(value):
+    # Relationships come back from Neo4jGraph.query as (start properties, type, end properties)
+    if isinstance(value, tuple) and len(value) == 3 and isinstance(value[1], str):
+        return f"{_node_name(value[0])} -[{value[1]}]-> {_node_name(value[2])}"
+    if isinstance(value, dict):
+        props = {k: v for k, v in value.items() if not _is_vector(k, v) and k != "text"}
+        if "id" in props and len(props) == 1:
+            return str(props["id"])
+        return ", ".join(f"{k}: {_render_value(v)}" for k, v in props.items())
+    if isinstance(value, list):
+        return "[" + ", ".join(_render_value(v) for v in value if not _is_vector(None, v)) + "]"
+    return str(value)
+
+def render_graph_row(row):
+    """
+    One compact line per row. An expansion triple [source, type, target] or a row
+    holding a relationship renders as 'source -[TYPE]-> target' (its n/m nodes are
+    redundant); other rows as 'key: value; ...'. Embedding vectors are dropped.
+    """
+    if isinstance(row, (list, tuple)) and len(row) == 3 and all(isinstance(v, str) for v in row):
+        return f"{row[0]} -[{row[1]}]-> {row[2]}"
+    if isinstance(row, dict):
+        relationships = [v for v in row.values() if isinstance(v, tuple) and len(v) == 3 and isinstance(v[1], str)]
+        if relationships:
+            return "; ".join(_render_value(r) for r in relationships)
+        return "; ".join(f"{k}: {_render_value(v)}" for k, v in row.items() if not _is_vector(k, v))
+    return _render_value(row)
+
+# --- RANKING ---
+
+_WORD = re.compile(r"\w+")
+
+def _terms(text):
+    return {w for w in _WORD.findall(text.lower()) if len(w) > 2}
+
+def rank_lines(question, lines, chunks):
+    """
+    Orders graph lines by relevance: words shared with the question first, then
+    with the retrieved chunks. Ties keep the retrieval order.
+    """
+    question_terms = _terms(question)
+    chunk_terms = _terms(" ".join(chunks))
+    scored = []
+    for position, line in enumerate(lines):
+        terms = _terms(line)
+        scored.append((-(2 * len(terms & question_terms) + len(terms & chunk_terms) / 10), position, line))
+    return [line for _, _, line in sorted(scored)]
+
+# --- PACKING ---
+
+class PackedContext:
+    def __init__(self, vector_context, graph_context, sources, stats):
+        self.vector_context = vector_context
+        self.graph_context = graph_context
+        self.sources = sources
+        self.stats = stats
+
+def pack_context(question, chunks, graph_rows, budget, vector_share=None):
+    """
+    Fits retrieved context into a token budget.
+    chunks: source documents ({"content", "source", "page"}) in similarity order.
+    graph_rows: raw Cypher rows or expansion triples.
+    Duplicates are dropped, graph facts are ranked against the question, and
+    items are added in rank order until each side's share of the budget is used
+    (a side needing less than its share leaves the rest to the other). The last
+    chunk that does not fit whole is cut to the remaining tokens.
+    """
+    vector_share = config.CONTEXT_VECTOR_SHARE if vector_share is None else vector_share
+
+    unique_chunks = list({c["content"]: c for c in chunks if c.get("content")}.values())
+    lines = list(dict.fromkeys(line for line in (render_graph_row(r) for r in graph_rows) if line))
+    lines = rank_lines(question, lines, [c["content"] for c in unique_chunks])
+
+    chunk_tokens = [count_tokens(c["content"]) + 1 for c in unique_chunks]
+    line_tokens = [count_tokens(line) + 1 for line in lines]
+    vector_needed, graph_needed = sum(chunk_tokens), sum(line_tokens)
+
+    vector_budget = min(vector_needed, max(int(budget * vector_share), budget - graph_needed))
+
+    packed_chunks, used = [], 0
+    for chunk, tokens in zip(unique_chunks, chunk_tokens):
+        if used + tokens <= vector_budget:
+            packed_chunks.append(chunk)
+            used += tokens
+            continue
+        remaining = vector_budget - used - 1
+        if remaining >= 32:
+            packed_chunks.append({**chunk, "content": truncate_tokens(chunk["content"], remaining)})
+            used = vector_budget
+        break
+    vector_used = used
+    graph_budget = budget - vector_used
+
+    packed_lines, used = [], 0
+    for line, tokens in zip(lines, line_tokens):
+        if used + tokens > graph_budget:
+            continue  # a shorter, lower-ranked fact may still fit
+        packed_lines.append(line)
+        used += tokens
+
+    stats = {
+        "budget": budget,
+        "context_tokens": vector_used + used,
+        "chunks": f"{len(packed_chunks)}/{len(chunks)}",
+        "graph_facts": f"{len(packed_lines)}/{len(graph_rows)}"
+    }
+    return PackedContext(
+        "\n".join(c["content"] for c in packed_chunks),
+        "\n".join(packed_lines),
+        packed_chunks,
+        stats
+    )
@@ -15,17 +15,259 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import atexit
+import threading
+import time
+import weakref
 from langchain_neo4j import Neo4jGraph
+from modules.vector_index import get_local_index
 import config
 
+# --- GRAPH VERSION ---
+# Token stored on a single meta node and replaced whenever the graph content changes
+# (ingestion, deletions, wipes). It lives in Neo4j rather than in this process so the
+# UI also notices changes made by ingest.py and job workers in other processes.
+# Long-lived consumers (RAG engines, caches) compare it to know when to refresh.
+META_LABEL = "__Mimir__"
+_graph_versions = weakref.WeakKeyDictionary()   # graph -> (version, read at)
+_graph_version_lock = threading.Lock()
+
+def get_graph_version(graph: Neo4jGraph):
+    """Current graph version (None before the first change); re-read at most every GRAPH_VERSION_POLL seconds."""
+    with _graph_version_lock:
+        cached = _graph_versions.get(graph)
+        if cached is not None and time.time() - cached[1] < config.GRAPH_VERSION_POLL:
+            return cached[0]
+    try:
+        rows = graph.query(f"MATCH (m:{META_LABEL} {{id: 'graph'}}) RETURN m.version AS version")
+        version = rows[0]["version"] if rows else None
+    except Exception as e:
+        print(f"⚠️ Warning: Could not read the graph version: {e}")
+        return cached[0] if cached else None
+    with _graph_version_lock:
+        _graph_versions[graph] = (version, time.time())
+    return version
+
+def mark_graph_changed(graph: Neo4jGraph):
+    """Signals that the graph was modified so cached schema/state gets refreshed in every process."""
+    rows = graph.query(
+        f"MERGE (m:{META_LABEL} {{id: 'graph'}}) SET m.version = randomUUID() RETURN m.version AS version"
+    )
+    with _graph_version_lock:
+        _graph_versions[graph] = (rows[0]["version"] if rows else None, time.time())
+
+# --- CONNECTION ---
+# One Neo4jGraph (and so one pooled Bolt driver) per process, shared by the UI,
+# the chat engines, the vector stores and the ingestion workers.
+_graph = None
+_graph_lock = threading.Lock()
+
 def get_graph_db():
-    """Establishes connection to Neo4j."""
-    return Neo4jGraph(
-        url=config.NEO4J_URI,
-        username=config.NEO4J_USERNAME,
-        password=config.NEO4J_PASSWORD
+    """
+    Returns the process-wide Neo4j connection, connecting on first use.
+    The schema is not introspected here; see get_schema().
+    Raises if Neo4j is unreachable (nothing is cached, so the next call retries).
+    """
+    global _graph
+    if _graph is not None:
+        return _graph
+    with _graph_lock:
+        if _graph is None:
+            _graph = Neo4jGraph(
+                url=config.NEO4J_URI,
+                username=config.NEO4J_USERNAME,
+                password=config.NEO4J_PASSWORD,
+                refresh_schema=False,
+                driver_config={
+                    "max_connection_pool_size": config.NEO4J_POOL_SIZE,
+                    "connection_acquisition_timeout": config.NEO4J_ACQUISITION_TIMEOUT,
+                    "connection_timeout": config.NEO4J_CONNECTION_TIMEOUT,
+                    "liveness_check_timeout": config.NEO4J_LIVENESS_CHECK
+                }
+            )
+        return _graph
+
+def ping():
+    """Cheap health check (a single RETURN 1 round trip on a pooled connection)."""
+    try:
+        get_graph_db().query("RETURN 1")
+        return True
+    except Exception:
+        return False
+
+@atexit.register
+def close_graph_db():
+    global _graph
+    with _graph_lock:
+        if _graph is not None:
+            _graph.close()
+            _graph = None
+
+# --- SCHEMA CACHE ---
+# Schema introspection (apoc.meta.data) scans the database, so it only runs when
+# the text-to-Cypher leg actually needs the schema, and is reused until the graph
+# changes or SCHEMA_REFRESH_TTL expires. Keyed per graph object (stand-ins included).
+_schema_loaded = weakref.WeakKeyDictionary()   # graph -> (graph version, loaded at)
+_schema_lock = threading.Lock()
+
+def get_schema(graph: Neo4jGraph):
+    """Returns the graph schema string (without Mimir's meta node), introspecting it lazily."""
+    version = get_graph_version(graph)
+    with _schema_lock:
+        loaded = _schema_loaded.get(graph)
+        if loaded is None or loaded[0] != version or time.time() - loaded[1] > config.SCHEMA_REFRESH_TTL:
+            graph.refresh_schema()
+            _schema_loaded[graph] = (version, time.time())
+    return "\n".join(line for line in graph.get_schema.splitlines() if META_LABEL not in line)
+
+# --- SCHEMA: CONSTRAINTS & INDEXES ---
+ENTITY_LABEL = "__Entity__"             # Added to every extracted entity (baseEntityLabel)
+ENTITY_FULLTEXT_INDEX = "entity_fulltext"
+
+SCHEMA_STATEMENTS = [
+    f"CREATE CONSTRAINT entity_id IF NOT EXISTS FOR (n:{ENTITY_LABEL}) REQUIRE n.id IS UNIQUE",
+    "CREATE CONSTRAINT chunk_id IF NOT EXISTS FOR (c:Chunk) REQUIRE c.id IS UNIQUE",
+    "CREATE INDEX chunk_source IF NOT EXISTS FOR (c:Chunk) ON (c.source)",
+    f"CREATE INDEX entity_pagerank IF NOT EXISTS FOR (n:{ENTITY_LABEL}) ON (n.pagerank)",
+    f"CREATE FULLTEXT INDEX {ENTITY_FULLTEXT_INDEX} IF NOT EXISTS FOR (n:{ENTITY_LABEL}) ON EACH [n.id, n.aliases]",
+]
+
+_indexed_graphs = weakref.WeakSet()
+
+def ensure_indexes(graph: Neo4jGraph):
+    """Creates the uniqueness constraints and the entity full-text index if missing (once per connection)."""
+    if graph in _indexed_graphs:
+        return
+    failed = False
+    for statement in SCHEMA_STATEMENTS:
+        try:
+            graph.query(statement)
+        except Exception as e:
+            failed = True
+            print(f"⚠️ Warning: Could not apply schema statement ({statement}): {e}")
+    if not failed:
+        _indexed_graphs.add(graph)
+
+# --- CHUNK MAINTENANCE ---
+
+def get_source_chunks(graph: Neo4jGraph, source_name):
+    """Returns {chunk id: extracted flag} for every Chunk ingested from a source."""
+    rows = graph.query(
+        "MATCH (c:Chunk {source: $source}) RETURN c.id AS id, coalesce(c.extracted, true) AS extracted",
+        {"source": source_name}
     )
+    return {row["id"]: row["extracted"] for row in rows}
+
+def delete_chunks(graph: Neo4jGraph, chunk_ids, batch_size=config.DELETE_BATCH_SIZE):
+    """
+    Deletes the given Chunk nodes, the relationships only they supported (their
+    id is dropped from chunk_ids; edges left with none go) and the entities that
+    no remaining chunk mentions.
+    Runs as batched transactions (CALL { } IN TRANSACTIONS) to keep heap usage flat.
+    """
+    chunk_ids = list(chunk_ids)
+    if not chunk_ids:
+        return 0
+    graph.query(f"""
+    UNWIND $ids AS id
+    CALL {{
+        WITH id
+        MATCH (c:Chunk {{id: id}})
+        OPTIONAL MATCH (c)-[:MENTIONS]->(e:{ENTITY_LABEL})
+        WITH c, id, collect(e) AS entities
+        CALL {{
+            WITH id, entities
+            UNWIND entities AS e
+            MATCH (e)-[r]->(:{ENTITY_LABEL})
+            WHERE id IN coalesce(r.chunk_ids, [])
+            SET r.chunk_ids = [x IN r.chunk_ids WHERE x <> id]
+            WITH r WHERE size(r.chunk_ids) = 0
+            DELETE r
+        }}
+        DETACH DELETE c
+        WITH entities
+        UNWIND entities AS e
+        WITH DISTINCT e
+        WHERE NOT (e)<-[:MENTIONS]-(:Chunk)
+        DETACH DELETE e
+    }} IN TRANSACTIONS OF $batch ROWS
+    """, {"ids": chunk_ids, "batch": batch_size})
+
+    local_index = get_local_index()
+    if local_index is not None:
+        local_index.delete(chunk_ids)
+    return len(chunk_ids)
+
+_sources_cache = {"key": None, "at": 0.0, "value": None}
+_sources_lock = threading.Lock()
+
+def list_sources(graph: Neo4jGraph):
+    """
+    Returns [{source, chunks}] for every ingested document or URL.
+    The grouping scans every Chunk, so the result is cached until the graph
+    version changes or STATS_CACHE_TTL expires (the Ingest view asks on every rerun).
+    """
+    key = get_graph_version(graph)
+    with _sources_lock:
+        fresh = time.time() - _sources_cache["at"] < config.STATS_CACHE_TTL
+        if _sources_cache["value"] is not None and _sources_cache["key"] == key and fresh:
+            return _sources_cache["value"]
+
+        rows = graph.query("""
+        MATCH (c:Chunk) WHERE c.source IS NOT NULL
+        RETURN c.source AS source, count(*) AS chunks
+        ORDER BY source
+        """)
+        _sources_cache.update(key=key, at=time.time(), value=rows)
+        return rows
+
+def delete_source(graph: Neo4jGraph, source_name, batch_size=config.DELETE_BATCH_SIZE, progress=None):
+    """
+    Removes one document: its chunks and the entities only it mentioned.
+    progress(deleted, total) is called after every slice of chunks.
+    """
+    total = graph.query(
+        "MATCH (c:Chunk {source: $source}) RETURN count(c) AS total", {"source": source_name}
+    )[0]["total"]
+    deleted = 0
+    while True:
+        rows = graph.query(
+            "MATCH (c:Chunk {source: $source}) RETURN c.id AS id LIMIT $limit",
+            {"source": source_name, "limit": batch_size * 10}
+        )
+        if not rows:
+            break
+        deleted += delete_chunks(graph, [row["id"] for row in rows], batch_size)
+        if progress:
+            progress(min(deleted, total), total)
+
+    mark_graph_changed(graph)
+    return deleted
+
+def clear_database(graph: Neo4jGraph, batch_size=config.DELETE_BATCH_SIZE, progress=None):
+    """
+    Wipes all nodes and relationships from the database in batched transactions.
+    progress(deleted, total) is called after every slice of nodes.
+    """
+    total = graph.query("MATCH (n) RETURN count(n) AS total")[0]["total"]
+    deleted = 0
+    while True:
+        result = graph.query("""
+        MATCH (n)
+        WITH n LIMIT $limit
+        CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF $batch ROWS
+        RETURN count(*) AS deleted
+        """, {"limit": batch_size * 10, "batch": batch_size})
+        count = result[0]["deleted"] if result else 0
+        if count == 0:
+            break
+        deleted += count
+        if progress:
+            progress(min(deleted, total), total)
+
+    local_index = get_local_index()
+    if local_index is not None:
+        local_index.clear()
 
-def clear_database(graph: Neo4jGraph):
-    """Wipes all nodes and relationships from the database."""
-    graph.query("MATCH (n) DETACH DELETE n")
\ No newline at end of file
+    mark_graph_changed(graph)
+    return deleted
\ No newline at end of file
@@ -0,0 +1,143 @@
+# This file is part of Mimir.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import re
+import time
+from collections import defaultdict
+from modules.database import ENTITY_LABEL, ensure_indexes
+import config
+
+def _quote(name, default):
+    """Backtick-quotes a label or relationship type (they cannot be query parameters)."""
+    cleaned = (name or "").replace("`", "").strip()
+    return f"`{cleaned or default}`"
+
+_CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_ALIAS_PROPERTIES = ("name", "alias", "aliases")
+
+def entity_aliases(node_id, properties):
+    """
+    Alternative names for the full-text index: the id split into words (the
+    analyzer keeps 'Graph_RAG' or 'GraphRag' as one token) plus any name/alias
+    properties the extraction produced.
+    """
+    names = set()
+    for key in _ALIAS_PROPERTIES:
+        value = properties.get(key)
+        names.update([value] if isinstance(value, str) else value if isinstance(value, list) else [])
+    spaced = " ".join(_CAMEL_BOUNDARY.sub(" ", str(node_id)).replace("_", " ").replace("-", " ").split())
+    names.add(spaced)
+    return sorted(n for n in names if isinstance(n, str) and n.strip() and n != node_id)
+
+class GraphWriter:
+    """
+    Writes extracted GraphDocuments with batched UNWIND upserts.
+    Entities are merged on the unique __Entity__ id, so each batch is an
+    index-backed MERGE and transaction size stays bounded by batch_size; their
+    aliases (see entity_aliases) feed the entity full-text index.
+    When the source chunk has an id, the chunk is linked via MENTIONS to every entity
+    its graph references, and each relationship records the ids of the chunks it was
+    extracted from (chunk_ids) so re-ingestion can retract facts a chunk alone supported.
+    """
+    def __init__(self, graph, batch_size=config.GRAPH_WRITE_BATCH_SIZE):
+        self.graph = graph
+        self.batch_size = max(1, batch_size)
+        ensure_indexes(graph)
+
+    def _run_batches(self, query, rows):
+        for start in range(0, len(rows), self.batch_size):
+            self.graph.query(query, {"rows": rows[start:start + self.batch_size]})
+
+    def write(self, graph_documents):
+        """Upserts all nodes and relationships. Returns row counts and throughput."""
+        start_time = time.time()
+
+        # 1. Deduplicate across documents (same entity extracted from many chunks)
+        nodes = {}
+        relationships = {}
+        rel_chunks = defaultdict(set)
+        mentions = defaultdict(set)
+        for doc in graph_documents:
+            chunk_id = getattr(doc.source, "id", None) if doc.source is not None else None
+            if chunk_id:
+                mentions[chunk_id].update(n.id for n in doc.nodes)
+                mentions[chunk_id].update(e.id for r in doc.relationships for e in (r.source, r.target))
+            for node in doc.nodes:
+                entry = nodes.setdefault(node.id, {"type": node.type, "properties": {}})
+                entry["properties"].update(node.properties or {})
+            for rel in doc.relationships:
+                for endpoint in (rel.source, rel.target):
+                    nodes.setdefault(endpoint.id, {"type": endpoint.type, "properties": {}})
+                key = (rel.source.id, rel.target.id, rel.type)
+                relationships.setdefault(key, {}).update(rel.properties or {})
+                if chunk_id:
+                    rel_chunks[key].add(chunk_id)
+
+        # 2. Nodes, one UNWIND query per label
+        nodes_by_type = defaultdict(list)
+        for node_id, entry in nodes.items():
+            properties = {k: v for k, v in entry["properties"].items() if k != "aliases"}
+            nodes_by_type[entry["type"]].append({
+                "id": node_id, "properties": properties, "aliases": entity_aliases(node_id, entry["properties"])
+            })
+
+        for node_type, rows in nodes_by_type.items():
+            self._run_batches(f"""
+            UNWIND $rows AS row
+            MERGE (n:{ENTITY_LABEL} {{id: row.id}})
+            SET n += row.properties
+            SET n.aliases = [a IN coalesce(n.aliases, []) WHERE NOT a IN row.aliases] + row.aliases
+            SET n:{_quote(node_type, "Node")}
+            """, rows)
+
+        # 3. Relationships, one UNWIND query per type
+        rels_by_type = defaultdict(list)
+        for key, properties in relationships.items():
+            source, target, rel_type = key
+            rels_by_type[rel_type].append({
+                "source": source, "target": target, "properties": properties, "chunk_ids": sorted(rel_chunks[key])
+            })
+
+        for rel_type, rows in rels_by_type.items():
+            self._run_batches(f"""
+            UNWIND $rows AS row
+            MATCH (s:{ENTITY_LABEL} {{id: row.source}})
+            MATCH (t:{ENTITY_LABEL} {{id: row.target}})
+            MERGE (s)-[r:{_quote(rel_type, "RELATED_TO")}]->(t)
+            SET r += row.properties
+            SET r.chunk_ids = [id IN coalesce(r.chunk_ids, []) WHERE NOT id IN row.chunk_ids] + row.chunk_ids
+            """, rows)
+
+        # 4. Provenance: Chunk -[:MENTIONS]-> entity (the Chunk is completed later by the vector store)
+        mention_rows = [{"chunk": chunk_id, "entities": sorted(ids)} for chunk_id, ids in mentions.items()]
+        self._run_batches(f"""
+        UNWIND $rows AS row
+        MERGE (c:Chunk {{id: row.chunk}})
+        WITH c, row
+        UNWIND row.entities AS entity_id
+        MATCH (e:{ENTITY_LABEL} {{id: entity_id}})
+        MERGE (c)-[:MENTIONS]->(e)
+        """, mention_rows)
+
+        duration = time.time() - start_time
+        total_rows = len(nodes) + len(relationships) + sum(len(r["entities"]) for r in mention_rows)
+        return {
+            "nodes": len(nodes),
+            "relationships": len(relationships),
+            "seconds": duration,
+            "rows_per_sec": total_rows / duration if duration > 0 else 0.0
+        }
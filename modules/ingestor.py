@@ -17,13 +17,30 @@
 
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader, UnstructuredMarkdownLoader, WebBaseLoader
+from langchain_community.graphs.graph_document import GraphDocument
+from langchain_core.documents import Document
 from langchain_experimental.graph_transformers import LLMGraphTransformer
 from langchain_neo4j import Neo4jVector
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from modules.llm import get_llm, get_embeddings
+from modules.cache import get_extraction_cache, ExtractionCache, content_hash
+from modules.database import mark_graph_changed, get_source_chunks, delete_chunks
+from modules.graph_writer import GraphWriter
+from modules.metrics import Trace
+from modules.vector_index import get_local_index
+from modules.context_packer import count_tokens
 import config
 
+SUPPORTED_EXTENSIONS = [".pdf", ".docx", ".txt", ".md"]
+
+# Markdown headings first, then paragraphs, lines, sentences and words
+CHUNK_SEPARATORS = ["\n# ", "\n## ", "\n### ", "\n#### ", "\n\n", "\n", ". ", " ", ""]
+
+# Between chunks packed into one extraction request
+BATCH_SEPARATOR = "\n\n---\n\n"
+
 def get_loader(file_path):
     ext = os.path.splitext(file_path)[1].lower()
     if ext == ".pdf": return PyPDFLoader(file_path)
@@ -32,48 +49,311 @@ def get_loader(file_path):
     elif ext == ".md": return UnstructuredMarkdownLoader(file_path)
     else: raise ValueError(f"Unsupported file format: {ext}")
 
+def chunking_settings(model_name):
+    """Chunk size, overlap and extraction batch size (tokens) for a model."""
+    settings = {
+        "chunk_tokens": config.CHUNK_TOKENS,
+        "chunk_overlap_tokens": config.CHUNK_OVERLAP_TOKENS,
+        "extraction_batch_tokens": config.EXTRACTION_BATCH_TOKENS
+    }
+    settings.update(config.MODEL_CHUNKING.get(model_name, {}))
+    return settings
+
+def _extract_chunk(llm_transformer, chunk, trace):
+    """Extracts the graph of a single chunk (or packed group), retrying transient LLM failures."""
+    delay = config.EXTRACTION_RETRY_BACKOFF
+    for attempt in range(config.EXTRACTION_MAX_RETRIES + 1):
+        try:
+            with trace.span("extract"):
+                return llm_transformer.process_response(chunk)
+        except Exception:
+            if attempt == config.EXTRACTION_MAX_RETRIES:
+                raise
+            time.sleep(delay)
+            delay *= 2
+
+def _group_chunks(chunks, indices, max_tokens):
+    """Packs consecutive chunks into groups of at most max_tokens (a larger chunk stays alone)."""
+    groups, group, size = [], [], 0
+    for i in indices:
+        tokens = count_tokens(chunks[i].page_content)
+        if group and size + tokens > max_tokens:
+            groups.append(group)
+            group, size = [], 0
+        group.append(i)
+        size += tokens
+    if group:
+        groups.append(group)
+    return groups
+
+def _split_group_graph(graph_document, chunks):
+    """
+    Maps a graph extracted from several packed chunks back onto each chunk.
+    A relationship belongs to the chunks whose text contains both endpoints
+    (else either one); a node to the chunks mentioning it or holding one of its
+    relationships. Whatever matches no chunk text belongs to the whole group:
+    it is written for every chunk of the group (so it is only retracted once all
+    of them are gone) but left out of the per-chunk cache entries.
+    Returns (graphs to write, graphs safe to cache), one of each per chunk.
+    """
+    texts = [chunk.page_content.casefold() for chunk in chunks]
+
+    def owners(node_id):
+        needle = str(node_id).casefold()
+        return {i for i, text in enumerate(texts) if needle in text}
+
+    nodes = [{} for _ in chunks]
+    relationships = [[] for _ in chunks]
+    shared_nodes, shared_relationships = {}, []
+    for rel in graph_document.relationships:
+        source, target = owners(rel.source.id), owners(rel.target.id)
+        placed = (source & target) or (source | target)
+        if not placed:
+            shared_relationships.append(rel)
+            continue
+        for i in placed:
+            relationships[i].append(rel)
+            nodes[i].setdefault((rel.source.id, rel.source.type), rel.source)
+            nodes[i].setdefault((rel.target.id, rel.target.type), rel.target)
+    for node in graph_document.nodes:
+        placed = owners(node.id) or {i for i, found in enumerate(nodes) if (node.id, node.type) in found}
+        if not placed:
+            shared_nodes[(node.id, node.type)] = node
+        for i in placed:
+            nodes[i][(node.id, node.type)] = node
+
+    cacheable = [
+        GraphDocument(nodes=list(nodes[i].values()), relationships=relationships[i], source=chunk)
+        for i, chunk in enumerate(chunks)
+    ]
+    if not shared_nodes and not shared_relationships:
+        return cacheable, cacheable
+    graphs = [
+        GraphDocument(
+            nodes=list({**shared_nodes, **nodes[i]}.values()),
+            relationships=relationships[i] + shared_relationships,
+            source=chunk
+        )
+        for i, chunk in enumerate(chunks)
+    ]
+    return graphs, cacheable
+
+def _extract_group(llm_transformer, chunks, trace):
+    """
+    Extracts one packed group of chunks in a single LLM request.
+    Returns (graphs to write, graphs safe to cache), one of each per chunk.
+    """
+    if len(chunks) == 1:
+        graphs = [_extract_chunk(llm_transformer, chunks[0], trace)]
+        return graphs, graphs
+    combined = Document(page_content=BATCH_SEPARATOR.join(chunk.page_content for chunk in chunks))
+    return _split_group_graph(_extract_chunk(llm_transformer, combined, trace), chunks)
+
+def _extract_graph(llm_transformer, chunks, model_name, trace, positions=None):
+    """
+    Runs graph extraction over all chunks with bounded parallelism.
+    Cached chunks are served from disk; misses are packed into groups of up to
+    extraction_batch_tokens so several chunks share one LLM request.
+    Results keep the chunk order; chunks whose group keeps failing are recorded and
+    skipped, reported by their position in the whole document (positions[i], which
+    counts unchanged and duplicate chunks too; the list index if not given).
+    """
+    positions = positions or list(range(len(chunks)))
+    results = [None] * len(chunks)
+    failures = []
+
+    cache = get_extraction_cache()
+    batch_tokens = chunking_settings(model_name)["extraction_batch_tokens"]
+    fingerprint = ExtractionCache.fingerprint(llm_transformer, model_name, batch_tokens) if cache else None
+    pending = []
+    for i, chunk in enumerate(chunks):
+        cached = cache.get_graph(chunk, fingerprint) if cache else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append(i)
+
+    groups = _group_chunks(chunks, pending, batch_tokens)
+    with ThreadPoolExecutor(max_workers=max(1, config.EXTRACTION_CONCURRENCY)) as pool:
+        futures = {pool.submit(_extract_group, llm_transformer, [chunks[i] for i in group], trace): group for group in groups}
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                graphs, cacheable = future.result()
+                for index, graph_document, cached_document in zip(group, graphs, cacheable):
+                    results[index] = graph_document
+                    if cache:
+                        cache.set_graph(chunks[index], fingerprint, cached_document)
+            except Exception as e:
+                for index in group:
+                    print(f"⚠️ Warning: Skipping chunk {positions[index]} after failed extraction: {e}")
+                    failures.append({"chunk": positions[index], "error": str(e)})
+
+    graph_documents = [doc for doc in results if doc is not None]
+    failures.sort(key=lambda f: f["chunk"])
+    return graph_documents, failures, len(chunks) - len(pending), len(groups)
+
+def get_text_splitter(model_name):
+    """Token-based splitter that prefers heading, paragraph and sentence boundaries."""
+    settings = chunking_settings(model_name)
+    return RecursiveCharacterTextSplitter(
+        chunk_size=settings["chunk_tokens"],
+        chunk_overlap=settings["chunk_overlap_tokens"],
+        length_function=count_tokens,
+        separators=CHUNK_SEPARATORS
+    )
+
+def _iter_chunk_batches(documents, source_name, batch_size, trace, model_name):
+    """
+    Splits documents (any iterable, e.g. a loader's lazy_load) page by page and
+    yields lists of at most batch_size chunks, so only one batch is held in memory.
+    """
+    text_splitter = get_text_splitter(model_name)
+    batch = []
+    for document in documents:
+        with trace.span("split"):
+            chunks = text_splitter.split_documents([document])
+        for chunk in chunks:
+            # Overwrite source metadata for better citations
+            chunk.metadata["source"] = source_name
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def _merge_write_stats(total, stats):
+    if stats is None:
+        return total
+    if total is None:
+        return dict(stats)
+    merged = {key: total[key] + stats[key] for key in ("nodes", "relationships", "seconds")}
+    rows = merged["nodes"] + merged["relationships"]
+    merged["rows_per_sec"] = rows / merged["seconds"] if merged["seconds"] > 0 else 0.0
+    return merged
+
 def _run_pipeline(documents, graph_db, model_name, source_name):
     """
     Core pipeline: Split -> Graph Extraction -> Vector Indexing.
     Used by both File and URL ingestors.
+    Documents are consumed lazily and processed in bounded chunk batches,
+    so peak memory does not grow with the size of the source.
+    Chunks are identified by source + content hash: on re-ingestion unchanged
+    chunks are skipped, new/changed ones are added and vanished ones deleted.
     """
-    # 1. Split Text
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_documents(documents)
-
-    # Overwrite source metadata for better citations
-    for doc in chunks:
-        doc.metadata["source"] = source_name
+    start_time = time.time()
+    trace = Trace("ingest")
 
-    # 2. GRAPH EXTRACTION (Structured)
     llm = get_llm(model_name=model_name, temperature=0)
     llm_transformer = LLMGraphTransformer(llm=llm)
+    graph_writer = GraphWriter(graph_db)
+    embeddings = get_embeddings()
+    vector_store = None
+    local_index = get_local_index()
 
-    start_time = time.time()
-    graph_documents = llm_transformer.convert_to_graph_documents(chunks)
+    # Chunks already stored for this source (re-ingestion only pays for the diff)
+    existing_chunks = get_source_chunks(graph_db, source_name)
+    seen_ids = set()
 
-    if graph_documents:
-        graph_db.add_graph_documents(graph_documents)
+    total_chunks = 0
+    processed_chunks = 0
+    unchanged_chunks = 0
+    total_graph_documents = 0
+    failures = []
+    cache_hits = 0
+    extraction_calls = 0
+    write_stats = None
 
-    # 3. VECTOR INDEXING (Unstructured/Semantic)
-    embeddings = get_embeddings()
+    # 1. Split Text (incrementally, one batch of chunks at a time)
+    documents = trace.timed_iter("load", documents)
+    for chunks in _iter_chunk_batches(documents, source_name, config.INGEST_BATCH_SIZE, trace, model_name):
+        first_position = total_chunks
+        total_chunks += len(chunks)
 
-    Neo4jVector.from_documents(
-        chunks,
-        embeddings,
-        url=config.NEO4J_URI,
-        username=config.NEO4J_USERNAME,
-        password=config.NEO4J_PASSWORD,
-        index_name="vector_index",
-        node_label="Chunk"
-    )
+        # Skip chunks whose content is already stored and fully extracted
+        pending = []
+        positions = []
+        for position, chunk in enumerate(chunks, start=first_position):
+            chunk_hash = content_hash(chunk.page_content)
+            chunk.id = content_hash(source_name, chunk_hash)
+            chunk.metadata["hash"] = chunk_hash
+            if chunk.id in seen_ids:
+                continue
+            seen_ids.add(chunk.id)
+            if existing_chunks.get(chunk.id):
+                unchanged_chunks += 1
+            else:
+                pending.append(chunk)
+                positions.append(position)
+
+        if not pending:
+            continue
+
+        # 2. GRAPH EXTRACTION (Structured)
+        graph_documents, batch_failures, batch_hits, batch_calls = _extract_graph(
+            llm_transformer, pending, model_name, trace, positions=positions
+        )
+        failures.extend(batch_failures)
+        cache_hits += batch_hits
+        extraction_calls += batch_calls
+        total_graph_documents += len(graph_documents)
+
+        # Failed chunks are still indexed, but flagged so the next re-ingest retries them
+        failed = {f["chunk"] for f in batch_failures}
+        for position, chunk in zip(positions, pending):
+            chunk.metadata["extracted"] = position not in failed
+
+        if graph_documents:
+            with trace.span("graph_write"):
+                write_stats = _merge_write_stats(write_stats, graph_writer.write(graph_documents))
+
+        # 3. VECTOR INDEXING (Unstructured/Semantic)
+        # Embedding and writing are separate steps so each shows up in the timing breakdown
+        texts = [chunk.page_content for chunk in pending]
+        metadatas = [chunk.metadata for chunk in pending]
+        chunk_ids = [chunk.id for chunk in pending]
+        with trace.span("embed"):
+            vectors = embeddings.embed_documents(texts)
+        with trace.span("vector_write"):
+            if vector_store is None:
+                vector_store = Neo4jVector.from_embeddings(
+                    list(zip(texts, vectors)),
+                    embeddings,
+                    metadatas=metadatas,
+                    ids=chunk_ids,
+                    graph=graph_db,
+                    index_name="vector_index",
+                    node_label="Chunk"
+                )
+            else:
+                vector_store.add_embeddings(texts, vectors, metadatas=metadatas, ids=chunk_ids)
+            # Chunk nodes stay the source of truth; the local index mirrors them
+            if local_index is not None:
+                local_index.add_embeddings(texts, vectors, metadatas=metadatas, ids=chunk_ids)
+
+        processed_chunks += len(pending)
+
+    # 4. Remove chunks that disappeared from the source (and entities only they mentioned)
+    with trace.span("cleanup"):
+        removed_chunks = delete_chunks(graph_db, [cid for cid in existing_chunks if cid not in seen_ids])
+
+    mark_graph_changed(graph_db)
 
     duration = time.time() - start_time
 
     return {
-        "pages": len(chunks),
-        "entities": len(graph_documents),
-        "duration": duration
+        "pages": total_chunks,
+        "new_chunks": processed_chunks,
+        "unchanged_chunks": unchanged_chunks,
+        "removed_chunks": removed_chunks,
+        "entities": total_graph_documents,
+        "duration": duration,
+        "failed_chunks": failures,
+        "cache_hits": cache_hits,
+        "extraction_calls": extraction_calls,
+        "graph_write": write_stats,
+        "timings": trace.stages
     }
 
 def process_file(file_path, graph_db, model_name, original_filename=None):
@@ -82,7 +362,7 @@ def process_file(file_path, graph_db, model_name, original_filename=None):
 
     try:
         loader = get_loader(file_path)
-        documents = loader.load()
+        documents = loader.lazy_load()
         return _run_pipeline(documents, graph_db, model_name, original_filename or file_path)
     except Exception as e:
         raise RuntimeError(f"Error processing file: {e}")
@@ -90,7 +370,7 @@ def process_file(file_path, graph_db, model_name, original_filename=None):
 def process_url(url, graph_db, model_name):
     try:
         loader = WebBaseLoader(url)
-        documents = loader.load()
+        documents = loader.lazy_load()
         return _run_pipeline(documents, graph_db, model_name, url)
     except Exception as e:
         raise RuntimeError(f"Error processing URL: {e}")
\ No newline at end of file
@@ -0,0 +1,259 @@
+# This file is part of Mimir.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from modules import database, ingestor
+import config
+
+STATUSES = ["queued", "running", "done", "failed"]
+
+def _owner_id():
+    """Unique per runner: hostnames and PIDs are reused by containers after a restart."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class JobLedger:
+    """
+    Persistent SQLite record of ingestion jobs (queued -> running -> done/failed).
+    Every call opens its own connection, so the ledger is safe to share between
+    worker threads, the Streamlit UI and CLI processes.
+    A running job holds a lease its runner keeps renewing; once the lease expires
+    (the runner died) the job can be claimed again.
+    """
+    def __init__(self, path=config.JOB_LEDGER_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                target TEXT NOT NULL,
+                source_name TEXT,
+                model TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                cleanup INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_until REAL,
+                error TEXT,
+                result TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "lease_until" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, kind, target, model_name, source_name=None, cleanup=False):
+        """Adds a 'file' or 'url' job. cleanup=True deletes the file once it is ingested."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, target, source_name, model, cleanup, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, target, source_name or target, model_name, int(cleanup), time.time())
+            )
+            return cursor.lastrowid
+
+    def claim(self, owner):
+        """
+        Atomically moves the oldest queued job (or a running one whose lease
+        expired) to 'running' under owner's lease and returns it (or None).
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("""
+            SELECT * FROM jobs
+            WHERE status = 'queued' OR (status = 'running' AND coalesce(lease_until, 0) < ?)
+            ORDER BY id LIMIT 1
+            """, (now,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, started_at = ? WHERE id = ?",
+                (owner, now + config.JOB_LEASE, now, row["id"])
+            )
+            conn.execute("COMMIT")
+            return dict(row)
+
+    def finish(self, job_id, owner, result):
+        """Records the result if owner still holds the job. Returns False if it was reclaimed."""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ? "
+                "WHERE id = ? AND status = 'running' AND owner = ?",
+                (json.dumps(result), time.time(), job_id, owner)
+            ).rowcount > 0
+
+    def fail(self, job_id, owner, error):
+        """Records the failure if owner still holds the job. Returns False if it was reclaimed."""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                "WHERE id = ? AND status = 'running' AND owner = ?",
+                (str(error), time.time(), job_id, owner)
+            ).rowcount > 0
+
+    def renew(self, owner):
+        """Extends the lease on every job the owner is running (the runner's heartbeat)."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE status = 'running' AND owner = ?",
+                (time.time() + config.JOB_LEASE, owner)
+            )
+
+    def resume_interrupted(self):
+        """Re-queues 'running' jobs whose lease expired (their runner died, e.g. before a restart)."""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, lease_until = NULL "
+                "WHERE status = 'running' AND coalesce(lease_until, 0) < ?",
+                (time.time(),)
+            ).rowcount
+
+    def retry_failed(self):
+        with self._connect() as conn:
+            return conn.execute("UPDATE jobs SET status = 'queued', error = NULL WHERE status = 'failed'").rowcount
+
+    def counts(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, count(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in STATUSES}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def list_jobs(self, limit=50):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["result"] = json.loads(job["result"]) if job["result"] else None
+            jobs.append(job)
+        return jobs
+
+def run_job(job):
+    """Executes one ledger job through the regular ingestion pipeline."""
+    graph = database.get_graph_db()
+    if job["kind"] == "file":
+        stats = ingestor.process_file(job["target"], graph, model_name=job["model"], original_filename=job["source_name"])
+        if job["cleanup"] and os.path.exists(job["target"]):
+            os.remove(job["target"])
+        return stats
+    if job["kind"] == "url":
+        return ingestor.process_url(job["target"], graph, model_name=job["model"])
+    raise ValueError(f"Unknown job kind: {job['kind']}")
+
+class JobRunner:
+    """
+    Pool of worker threads draining the ledger.
+    With exit_when_idle=True (CLI) workers stop once the queue is empty;
+    otherwise (UI) they keep polling for new jobs in the background.
+    """
+    def __init__(self, ledger, workers=config.JOB_WORKERS, exit_when_idle=False):
+        self.ledger = ledger
+        self.workers = max(1, workers)
+        self.exit_when_idle = exit_when_idle
+        self.owner = _owner_id()
+        self._threads = []
+
+    def start(self):
+        resumed = self.ledger.resume_interrupted()
+        if resumed:
+            print(f"🔁 Resuming {resumed} interrupted ingestion job(s)")
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"mimir-ingest-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._heartbeat, name="mimir-ingest-lease", daemon=True).start()
+        return self
+
+    def _heartbeat(self):
+        while any(thread.is_alive() for thread in self._threads):
+            time.sleep(config.JOB_LEASE / 3)
+            try:
+                self.ledger.renew(self.owner)
+            except Exception as e:
+                print(f"⚠️ Warning: Could not renew ingestion job leases: {e}")
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            job = self.ledger.claim(self.owner)
+            if job is None:
+                if self.exit_when_idle:
+                    return
+                time.sleep(config.JOB_POLL_INTERVAL)
+                continue
+
+            print(f"⚙️ Job {job['id']}: ingesting {job['source_name']}")
+            try:
+                result = run_job(job)
+            except Exception as e:
+                if self.ledger.fail(job["id"], self.owner, e):
+                    print(f"❌ Job {job['id']} failed: {e}")
+                else:
+                    print(f"⚠️ Job {job['id']} failed after its lease was taken over; dropping the error: {e}")
+                continue
+            if self.ledger.finish(job["id"], self.owner, result):
+                print(f"✅ Job {job['id']} done")
+            else:
+                print(f"⚠️ Job {job['id']} finished after its lease was taken over; dropping the result")
+
+_ledger = None
+_runner = None
+_lock = threading.Lock()
+
+def get_ledger():
+    global _ledger
+    with _lock:
+        if _ledger is None:
+            _ledger = JobLedger()
+        return _ledger
+
+def ensure_background_runner():
+    """Starts the process-wide background workers once (used by the Streamlit UI)."""
+    global _runner
+    ledger = get_ledger()
+    with _lock:
+        if _runner is None:
+            _runner = JobRunner(ledger).start()
+        return _runner
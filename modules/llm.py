@@ -17,74 +17,321 @@
 
 import requests
 import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+import httpx
+from ollama import Client, AsyncClient, ResponseError
+from pydantic import Field
+from langchain_core.embeddings import Embeddings
 from langchain_ollama import ChatOllama, OllamaEmbeddings
+from modules.cache import EmbeddingCache
+from modules.metrics import TokenUsageCallback, OLLAMA_REQUESTS
 import config
 
-def _get_local_models():
-    """Helper to get the list of installed models from Ollama."""
-    try:
-        response = requests.get(f"{config.OLLAMA_BASE_URL}/api/tags")
-        if response.status_code == 200:
-            models_data = response.json()
-            return [m['name'] for m in models_data['models']]
-    except Exception as e:
-        print(f"⚠️ Warning: Could not connect to Ollama: {e}")
-        return []
-    return []
+def _normalize_model_name(model_name):
+    """Ollama assumes the :latest tag when none is given."""
+    return model_name if ":" in model_name else f"{model_name}:latest"
+
+class ModelRegistry:
+    """
+    Cached view of the models installed in Ollama.
+    Reuses one keep-alive HTTP session and only re-reads /api/tags once the TTL
+    expires or after a pull, so UI reruns and engine setup stay off the network.
+    """
+    def __init__(self, base_url, ttl=config.MODEL_TAGS_TTL):
+        self.base_url = base_url
+        self.ttl = ttl
+        self.session = requests.Session()
+        self._models = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def list_models(self, force=False):
+        """Returns installed model names, or None when Ollama cannot be reached."""
+        with self._lock:
+            if not force and self._models is not None and time.time() - self._fetched_at < self.ttl:
+                return self._models
+
+            try:
+                response = self.session.get(f"{self.base_url}/api/tags", timeout=10)
+                response.raise_for_status()
+                self._models = [m['name'] for m in response.json()['models']]
+                self._fetched_at = time.time()
+                return self._models
+            except Exception as e:
+                print(f"⚠️ Warning: Could not connect to Ollama: {e}")
+                return None
+
+    def invalidate(self):
+        with self._lock:
+            self._models = None
+
+    def is_available(self, model_name):
+        local_models = self.list_models() or []
+        check_name = _normalize_model_name(model_name)
+        # Check for partial match (e.g. "llama3.2" matching "llama3.2:latest")
+        return any(check_name in m for m in local_models)
+
+    def pull(self, model_name):
+        """
+        Downloads a model, yielding Ollama's progress events as dicts
+        (status, and total/completed bytes while layers download).
+        """
+        try:
+            payload = {"name": model_name}
+            # stream=True is important to prevent timeouts on large downloads
+            with self.session.post(f"{self.base_url}/api/pull", json=payload, stream=True) as r:
+                r.raise_for_status()
+                for line in r.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if "error" in event:
+                        raise RuntimeError(event["error"])
+                    yield event
+        finally:
+            self.invalidate()
+
+    def ensure(self, model_name):
+        """Pulls the model if it is missing. Returns True once it can be used."""
+        local_models = self.list_models()
+        if local_models is None:
+            # We proceed to try creating the LLM anyway, letting LangChain handle errors
+            return True
+        if self.is_available(model_name):
+            return True # Model exists, no need to download
+
+        print(f"⬇️ Model '{model_name}' not found locally. Starting download...")
+        try:
+            for _ in self.pull(model_name):
+                pass
+        except Exception as e:
+            raise RuntimeError(f"Failed to pull model {model_name}: {e}")
+        print(f"✅ Model '{model_name}' downloaded successfully!")
+        return True
+
+# --- ENDPOINT POOLS ---
+
+def _is_failover_error(error):
+    """Errors worth retrying on another endpoint: unreachable, overloaded or missing the model."""
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500 or error.status_code == 404
+    return isinstance(error, (ConnectionError, TimeoutError, httpx.TransportError))
+
+class Endpoint:
+    """One Ollama server: its cached model list (which doubles as health check) and in-flight requests."""
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.registry = ModelRegistry(self.url)
+        self.client = Client(host=self.url)
+        self.in_flight = 0
+        self.down_until = 0.0
+
+    @property
+    def available(self):
+        return time.time() >= self.down_until
+
+    def has_model(self, model_name):
+        if self.registry.list_models() is None:
+            self.mark_down()
+            return False
+        return self.registry.is_available(model_name)
+
+    def mark_down(self):
+        """Skips the endpoint for OLLAMA_RETRY_AFTER seconds; it is re-checked through /api/tags afterwards."""
+        self.down_until = time.time() + config.OLLAMA_RETRY_AFTER
+        self.registry.invalidate()
+
+class OllamaPool:
+    """
+    Spreads requests over several Ollama endpoints.
+    Each request goes to the least-loaded (fewest in-flight requests) healthy endpoint
+    that has the model, and fails over to the next one on connection errors, 5xx
+    answers or a missing model. Streams only fail over before their first part.
+    """
+    def __init__(self, name, urls):
+        self.name = name
+        self.endpoints = [Endpoint(url) for url in dict.fromkeys(urls)]
+        self._lock = threading.Lock()
+        self._turn = 0
+
+    def route(self, model_name):
+        """Endpoints to try for a model, least loaded first (ties rotate)."""
+        candidates = [e for e in self.endpoints if e.available and e.has_model(model_name)]
+        if not candidates:
+            # Nobody reports the model: try whatever is up (or, as a last resort, everything)
+            candidates = [e for e in self.endpoints if e.available] or list(self.endpoints)
+        with self._lock:
+            self._turn += 1
+            turn = self._turn
+            count = len(self.endpoints)
+            return sorted(candidates, key=lambda e: (e.in_flight, (self.endpoints.index(e) - turn) % count))
+
+    def _acquire(self, endpoint):
+        with self._lock:
+            endpoint.in_flight += 1
+
+    def _release(self, endpoint):
+        with self._lock:
+            endpoint.in_flight -= 1
+
+    def _failed(self, endpoint, model_name, error):
+        print(f"⚠️ Warning: Ollama endpoint {endpoint.url} failed for {model_name}, failing over: {error}")
+        OLLAMA_REQUESTS.inc(pool=self.name, endpoint=endpoint.url, status="failover")
+        if isinstance(error, ResponseError) and error.status_code == 404:
+            # Model missing there (e.g. removed): refresh its model list, keep it for other models
+            endpoint.registry.invalidate()
+        else:
+            endpoint.mark_down()
+
+    def _no_endpoint(self, model_name, error):
+        return ConnectionError(f"No Ollama endpoint in the {self.name} pool could serve {model_name}: {error}")
+
+    def call(self, model_name, request):
+        """Runs request(client) on the best endpoint and returns its result."""
+        last_error = None
+        for endpoint in self.route(model_name):
+            self._acquire(endpoint)
+            try:
+                result = request(endpoint.client)
+            except Exception as e:
+                if not _is_failover_error(e):
+                    raise
+                self._failed(endpoint, model_name, e)
+                last_error = e
+                continue
+            finally:
+                self._release(endpoint)
+            OLLAMA_REQUESTS.inc(pool=self.name, endpoint=endpoint.url, status="ok")
+            return result
+        raise self._no_endpoint(model_name, last_error)
+
+    def stream(self, model_name, request):
+        """Yields the parts of request(client), an iterator of response chunks."""
+        last_error = None
+        for endpoint in self.route(model_name):
+            self._acquire(endpoint)
+            started = False
+            try:
+                for part in request(endpoint.client):
+                    started = True
+                    yield part
+            except Exception as e:
+                if started or not _is_failover_error(e):
+                    raise
+                self._failed(endpoint, model_name, e)
+                last_error = e
+                continue
+            finally:
+                self._release(endpoint)
+            OLLAMA_REQUESTS.inc(pool=self.name, endpoint=endpoint.url, status="ok")
+            return
+        raise self._no_endpoint(model_name, last_error)
+
+    async def astream(self, model_name, request):
+        """
+        Async counterpart of stream(): request(async_client) is awaited and may return
+        one response or an async iterator of chunks. A client is opened per request,
+        since callers run on short-lived event loops (asyncio.run).
+        """
+        last_error = None
+        for endpoint in self.route(model_name):
+            self._acquire(endpoint)
+            client = AsyncClient(host=endpoint.url)
+            started = False
+            try:
+                result = await request(client)
+                if hasattr(result, "__aiter__"):
+                    async for part in result:
+                        started = True
+                        yield part
+                else:
+                    started = True
+                    yield result
+            except Exception as e:
+                if started or not _is_failover_error(e):
+                    raise
+                self._failed(endpoint, model_name, e)
+                last_error = e
+                continue
+            finally:
+                self._release(endpoint)
+                await client.close()
+            OLLAMA_REQUESTS.inc(pool=self.name, endpoint=endpoint.url, status="ok")
+            return
+        raise self._no_endpoint(model_name, last_error)
+
+    def is_available(self, model_name):
+        return any(e.available and e.has_model(model_name) for e in self.endpoints)
+
+    def pull(self, model_name):
+        """Downloads a model on the least-loaded live endpoint (see ModelRegistry.pull)."""
+        return self.route(model_name)[0].registry.pull(model_name)
+
+    def ensure(self, model_name):
+        """Pulls the model onto one endpoint unless some live endpoint already has it."""
+        if self.is_available(model_name):
+            return True
+        return self.route(model_name)[0].registry.ensure(model_name)
+
+    def health(self):
+        """Per-endpoint status, e.g. for dashboards."""
+        return [{
+            "url": e.url,
+            "healthy": e.available and e.registry.list_models() is not None,
+            "in_flight": e.in_flight,
+            "models": e.registry.list_models() or []
+        } for e in self.endpoints]
+
+# Chat/extraction and embedding traffic use separate pools (possibly separate machines)
+chat_pool = OllamaPool("chat", config.OLLAMA_CHAT_URLS)
+embed_pool = OllamaPool("embed", config.OLLAMA_EMBED_URLS)
+
+class PooledChatOllama(ChatOllama):
+    """ChatOllama whose requests are routed through an OllamaPool instead of a single base_url."""
+    pool: Any = Field(default=None, exclude=True)
+
+    def _create_chat_stream(self, messages, stop=None, **kwargs):
+        chat_params = self._chat_params(messages, stop, **kwargs)
+        if chat_params["stream"]:
+            yield from self.pool.stream(self.model, lambda client: client.chat(**chat_params))
+        else:
+            yield self.pool.call(self.model, lambda client: client.chat(**chat_params))
+
+    async def _acreate_chat_stream(self, messages, stop=None, **kwargs):
+        chat_params = self._chat_params(messages, stop, **kwargs)
+        async for part in self.pool.astream(self.model, lambda client: client.chat(**chat_params)):
+            yield part
+
+class PooledOllamaEmbeddings(OllamaEmbeddings):
+    """OllamaEmbeddings routed through an OllamaPool."""
+    pool: Any = Field(default=None, exclude=True)
+
+    def embed_documents(self, texts):
+        return self.pool.call(self.model, lambda client: client.embed(
+            self.model,
+            texts,
+            dimensions=self.dimensions,
+            options=self._default_params,
+            keep_alive=self.keep_alive
+        ))["embeddings"]
 
 def is_model_available(model_name):
-    """Returns True if the model is already installed locally."""
-    local_models = _get_local_models()
-    # Normalize naming (Ollama assumes :latest)
-    check_name = model_name if ":" in model_name else f"{model_name}:latest"
+    """Returns True if the model is already installed on a chat endpoint."""
+    return chat_pool.is_available(model_name)
 
-    # Check for partial match (e.g. "llama3.2" matching "llama3.2:latest")
-    return any(check_name in m for m in local_models)
+def pull_model(model_name):
+    """Generator of pull progress events, for rendering downloads in the UI."""
+    return chat_pool.pull(model_name)
 
-def check_and_pull_model(model_name):
+def check_and_pull_model(model_name, pool=chat_pool):
     """
-    Checks if the model exists locally in Ollama.
+    Checks if the model exists in the pool's Ollama endpoints.
     If not, it triggers a download (pull) via the API.
     """
-    base_url = config.OLLAMA_BASE_URL
-
-    # 1. Get list of local models
-    try:
-        response = requests.get(f"{base_url}/api/tags")
-        if response.status_code == 200:
-            models_data = response.json()
-            # Extract model names (e.g., "llama3.2:latest")
-            local_models = [m['name'] for m in models_data['models']]
-
-            # Normalize names for comparison (Ollama adds :latest automatically)
-            model_check = model_name if ":" in model_name else f"{model_name}:latest"
-
-            # Check if model exists (checking for partial match to be safe)
-            if any(model_check in m for m in local_models):
-                return True # Model exists, no need to download
-
-    except Exception as e:
-        print(f"⚠️ Warning: Could not check local models: {e}")
-        # We proceed to try creating the LLM anyway, letting LangChain handle errors
-        return True
-
-    # 2. If model is missing, trigger Pull
-    print(f"⬇️ Model '{model_name}' not found locally. Starting download...")
-
-    try:
-        payload = {"name": model_name}
-        # stream=True is important to prevent timeouts on large downloads
-        with requests.post(f"{base_url}/api/pull", json=payload, stream=True) as r:
-            r.raise_for_status()
-            # Consume the stream to ensure download completes before proceeding
-            for line in r.iter_lines():
-                if line:
-                    # Optional: Parse JSON line to show progress in logs
-                    pass
-        print(f"✅ Model '{model_name}' downloaded successfully!")
-        return True
-    except Exception as e:
-        raise RuntimeError(f"Failed to pull model {model_name}: {e}")
+    return pool.ensure(model_name)
 
 def get_llm(model_name=None, temperature=0):
     """
@@ -98,18 +345,85 @@ def get_llm(model_name=None, temperature=0):
     check_and_pull_model(selected_model)
     # ---------------------------
 
-    return ChatOllama(
+    return PooledChatOllama(
         model=selected_model,
         temperature=temperature,
-        base_url=config.OLLAMA_BASE_URL
+        base_url=chat_pool.endpoints[0].url,
+        pool=chat_pool,
+        callbacks=[TokenUsageCallback(selected_model)]
     )
 
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings provider in front of OllamaEmbeddings.
+    Documents are deduplicated, served from the disk cache when possible and
+    embedded in fixed-size batches; query vectors are kept in an in-memory LRU.
+    """
+    def __init__(self, embeddings, model_name, disk_cache=None,
+                 batch_size=config.EMBEDDING_BATCH_SIZE, query_cache_size=config.QUERY_EMBEDDING_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.disk_cache = disk_cache
+        self.batch_size = max(1, batch_size)
+        self.query_cache_size = query_cache_size
+        self._query_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        unique = list(dict.fromkeys(texts))
+        vectors = self.disk_cache.get_vectors(unique) if self.disk_cache else {}
+        missing = [t for t in unique if t not in vectors]
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            embedded = dict(zip(batch, self.embeddings.embed_documents(batch)))
+            if self.disk_cache:
+                self.disk_cache.set_vectors(embedded)
+            vectors.update(embedded)
+
+        return [vectors[t] for t in texts]
+
+    def embed_query(self, text):
+        with self._lock:
+            if text in self._query_cache:
+                self._query_cache.move_to_end(text)
+                return self._query_cache[text]
+
+        vector = self.embeddings.embed_query(text)
+
+        with self._lock:
+            self._query_cache[text] = vector
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
 def get_embeddings():
-    """Returns the configured Embedding model."""
-    # We ensure the embedding model is available (usually handled by Docker, but safe to check)
-    check_and_pull_model(config.EMBEDDING_MODEL)
-
-    return OllamaEmbeddings(
-        model=config.EMBEDDING_MODEL,
-        base_url=config.OLLAMA_BASE_URL
-    )
\ No newline at end of file
+    """Returns the configured Embedding model, wrapped with batching and caching."""
+    global _embeddings
+
+    with _embeddings_lock:
+        if _embeddings is None:
+            # We ensure the embedding model is available (usually handled by Docker, but safe to check)
+            check_and_pull_model(config.EMBEDDING_MODEL, embed_pool)
+
+            disk_cache = None
+            if config.EMBEDDING_CACHE_ENABLED:
+                disk_cache = EmbeddingCache(
+                    config.EMBEDDING_CACHE_PATH,
+                    config.EMBEDDING_CACHE_MAX_ENTRIES,
+                    config.EMBEDDING_MODEL
+                )
+
+            _embeddings = CachedEmbeddings(
+                PooledOllamaEmbeddings(
+                    model=config.EMBEDDING_MODEL,
+                    base_url=embed_pool.endpoints[0].url,
+                    pool=embed_pool
+                ),
+                model_name=config.EMBEDDING_MODEL,
+                disk_cache=disk_cache
+            )
+        return _embeddings
\ No newline at end of file
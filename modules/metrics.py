@@ -0,0 +1,238 @@
+# This file is part of Mimir.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.callbacks import BaseCallbackHandler
+import config
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=None):
+    items = list(key) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self, **labels):
+        """Sum over every series matching the given labels."""
+        with self._lock:
+            return sum(v for key, v in self._values.items() if labels.items() <= dict(key).items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in self._series.items():
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+# --- METRICS ---
+STAGE_SECONDS = Histogram("mimir_stage_seconds", "Duration of ingestion and query stages.")
+STAGE_ERRORS = Counter("mimir_stage_errors_total", "Stages that ended in an error or timeout.")
+LLM_CALLS = Counter("mimir_llm_calls_total", "LLM calls made through Ollama.")
+LLM_TOKENS = Counter("mimir_llm_tokens_total", "Tokens processed by LLM calls (kind=prompt|completion).")
+LLM_CALL_TOKENS = Histogram(
+    "mimir_llm_call_tokens", "Prompt plus completion tokens per LLM call.",
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+)
+OLLAMA_REQUESTS = Counter("mimir_ollama_requests_total", "Requests per Ollama endpoint (status=ok|failover).")
+PROMPT_TOKENS = Histogram(
+    "mimir_synthesis_prompt_tokens", "Synthesis prompt size (kind=packed, or raw = unpacked retrieval results).",
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+)
+REGISTRY = [STAGE_SECONDS, STAGE_ERRORS, LLM_CALLS, LLM_TOKENS, LLM_CALL_TOKENS, OLLAMA_REQUESTS, PROMPT_TOKENS]
+
+def render_prometheus():
+    """Prometheus text exposition of every Mimir metric."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# --- TRACING ---
+
+class Trace:
+    """
+    Per-request timing breakdown (one ingestion or one chat question).
+    Stages that run several times (e.g. extraction per chunk) are summed and counted.
+    Every span is also observed by the process-wide histograms.
+    """
+    def __init__(self, kind):
+        self.kind = kind
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, status="ok"):
+        STAGE_SECONDS.observe(seconds, kind=self.kind, stage=stage)
+        if status not in ("ok", "hit", "miss"):
+            STAGE_ERRORS.inc(kind=self.kind, stage=stage, status=status)
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"seconds": 0.0, "count": 0, "status": "ok"})
+            entry["seconds"] += seconds
+            entry["count"] += 1
+            if status != "ok":
+                entry["status"] = status
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, status)
+
+    def merge(self, other):
+        """Adds another trace's stages (already observed by the histograms), e.g. a finished retrieval leg."""
+        with other._lock:
+            stages = {stage: dict(entry) for stage, entry in other.stages.items()}
+        with self._lock:
+            for stage, theirs in stages.items():
+                entry = self.stages.setdefault(stage, {"seconds": 0.0, "count": 0, "status": "ok"})
+                entry["seconds"] += theirs["seconds"]
+                entry["count"] += theirs["count"]
+                if theirs["status"] != "ok":
+                    entry["status"] = theirs["status"]
+
+    def timed_iter(self, stage, iterable):
+        """Wraps an iterator so the time spent producing items is recorded under stage."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.record(stage, time.perf_counter() - start)
+                return
+            self.record(stage, time.perf_counter() - start)
+            yield item
+
+def format_breakdown(stages):
+    """One-line summary of a Trace's stages, e.g. 'embed 0.42s · extract 12.10s (x40)'."""
+    parts = []
+    for stage, t in stages.items():
+        part = f"{stage} {t['seconds']:.2f}s"
+        if t.get("count", 1) > 1:
+            part += f" (x{t['count']})"
+        if t["status"] != "ok":
+            part += f" ({t['status']})"
+        parts.append(part)
+    return " · ".join(parts)
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Counts LLM calls and prompt/completion tokens reported by Ollama."""
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                prompt_tokens = usage.get("input_tokens", 0)
+                completion_tokens = usage.get("output_tokens", 0)
+                LLM_CALLS.inc(model=self.model_name)
+                LLM_TOKENS.inc(prompt_tokens, model=self.model_name, kind="prompt")
+                LLM_TOKENS.inc(completion_tokens, model=self.model_name, kind="completion")
+                LLM_CALL_TOKENS.observe(prompt_tokens + completion_tokens, model=self.model_name)
+
+# --- EXPORT ---
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=None):
+    """Serves /metrics for Prometheus on a background thread (once per process)."""
+    global _server
+    port = config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                print(f"⚠️ Warning: Metrics endpoint not started on port {port}: {e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="mimir-metrics", daemon=True).start()
+        return _server
@@ -15,13 +15,22 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import asyncio
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import config
-from langchain_neo4j import GraphCypherQAChain
-from langchain_core.prompts import PromptTemplate
-from modules.llm import get_llm
-from langchain_neo4j import GraphCypherQAChain, Neo4jVector
+from langchain_neo4j import Neo4jVector
+from langchain_neo4j.chains.graph_qa.cypher import extract_cypher
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
 from modules.llm import get_llm, get_embeddings
+from modules import database
+from modules.cache import SemanticAnswerCache, CypherCache
+from modules.metrics import Trace, PROMPT_TOKENS
+from modules.vector_index import get_local_index
+from modules.context_packer import pack_context, context_budget, count_tokens
 
 # --- PROMPTS ---
 CYPHER_GENERATION_TEMPLATE = """Task: Generate Cypher statement to question a graph database.
@@ -34,12 +43,81 @@ Schema:
 
 CRITICAL STRATEGY:
 1. **Search Logic:** ALWAYS retrieve the node AND all its immediate relationships.
-2. **Fuzzy Matching:** Always use `toLower(n.id) CONTAINS "term"`.
-3. **Universal Pattern:** `MATCH (n)-[r]-(m) WHERE toLower(n.id) CONTAINS "term" RETURN n, r, m`
+2. **Entity Lookup:** Always find entities through the full-text index `entity_fulltext`, never with CONTAINS.
+3. **Universal Pattern:** `CALL db.index.fulltext.queryNodes("entity_fulltext", "term") YIELD node AS n MATCH (n)-[r]-(m) RETURN n, r, m`
 
 The question is:
 {question}"""
 
+# Legacy scan pattern: MATCH (n)... WHERE toLower(n.id) CONTAINS "term" RETURN ...
+_CONTAINS_LOOKUP = re.compile(
+    r"MATCH\s+\((?P<var>\w+)\)(?P<pattern>[^\n]*?)\s+WHERE\s+toLower\((?P=var)\.id\)\s+CONTAINS\s+"
+    r"(?:toLower\()?(?P<quote>[\"'])(?P<term>[^\"']+)(?P=quote)\)?\s+RETURN\b",
+    re.IGNORECASE
+)
+_LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+def _fulltext_query(term):
+    """Turns a free-text term into a Lucene query requiring every word."""
+    words = [_LUCENE_SPECIAL.sub(r"\\\1", w) for w in term.split()]
+    return " AND ".join(words)
+
+def rewrite_entity_lookup(cypher):
+    """
+    Rewrites the label-scanning CONTAINS lookup into an entity_fulltext index lookup,
+    for models that ignore the prompt and still emit CONTAINS.
+    """
+    def replace(match):
+        query = _fulltext_query(match.group("term")).replace("\\", "\\\\").replace('"', '\\"')
+        return (
+            f'CALL db.index.fulltext.queryNodes("{database.ENTITY_FULLTEXT_INDEX}", "{query}") '
+            f'YIELD node AS {match.group("var")} '
+            f'MATCH ({match.group("var")}){match.group("pattern")} RETURN'
+        )
+    return _CONTAINS_LOOKUP.sub(replace, cypher)
+
+# Rows kept from a generated Cypher query; the context packer then fits them to the token budget
+GRAPH_RESULT_LIMIT = 200
+# Chunks returned by the semantic search
+VECTOR_TOP_K = 3
+
+# --- GRAPH EXPANSION (default retrieval) ---
+# Walks from the matched chunks to the entities they MENTION, then up to
+# {hops} relationships between entities. Hop bounds cannot be Cypher parameters.
+# seeds = 0 for matched chunks means they have no MENTIONS (ingested before provenance links).
+_EXPANSION_TAIL = """
+CALL {{
+    WITH chunk_nodes
+    UNWIND chunk_nodes AS c
+    MATCH (c)-[:MENTIONS]->(seed:{entity})
+    RETURN collect(DISTINCT seed) AS seeds
+}}
+CALL {{
+    WITH seeds
+    UNWIND seeds AS seed
+    MATCH p = (seed)-[*1..{hops}]-(:{entity})
+    WHERE all(n IN nodes(p) WHERE n:{entity})
+    UNWIND relationships(p) AS r
+    WITH DISTINCT r LIMIT $limit
+    RETURN collect([startNode(r).id, type(r), endNode(r).id]) AS triples
+}}
+RETURN chunks, triples, size(seeds) AS seeds
+"""
+
+# Vector top-k and expansion in a single round trip
+VECTOR_EXPANSION_QUERY = """
+CALL db.index.vector.queryNodes($index, $k, $embedding) YIELD node, score
+WITH collect(node) AS chunk_nodes,
+     collect({{id: node.id, text: node.text, source: node.source, page: node.page, score: score}}) AS chunks
+""" + _EXPANSION_TAIL
+
+# Expansion only, for chunks already found by the local vector index
+CHUNK_EXPANSION_QUERY = """
+UNWIND $ids AS id
+MATCH (node:Chunk {{id: id}})
+WITH collect(node) AS chunk_nodes, [] AS chunks
+""" + _EXPANSION_TAIL
+
 HYBRID_QA_TEMPLATE = """You are Mimir, an advanced hybrid AI assistant.
 You have context from two sources: Structured Knowledge Graph and Semantic Vector Search.
 
@@ -65,16 +143,44 @@ Answer:"""
 class HybridRAG:
     def __init__(self, graph_db, model_name):
         self.graph = graph_db
+        self.model_name = model_name
         self.llm = get_llm(model_name, temperature=0)
         self.embeddings = get_embeddings()
 
+        self._lock = threading.Lock()
+        self._graph_version = database.get_graph_version(self.graph)
+        self._vector_checked_at = time.time()
+        self._warned_unlinked = False
+
+        # Entity lookups in generated Cypher rely on the full-text index
+        database.ensure_indexes(self.graph)
+
         # 1. Setup Vector Retriever (Try connecting to existing index)
+        self.vector_store = self._connect_vector_store()
+
+        # 2. Setup Graph Chain (question -> Cypher; executed by _graph_search)
+        cypher_prompt = PromptTemplate(
+            input_variables=["schema", "question"],
+            template=CYPHER_GENERATION_TEMPLATE
+        )
+        self.cypher_chain = cypher_prompt | self.llm | StrOutputParser()
+
+        # 3. Setup Hybrid Synthesis
+        final_prompt = PromptTemplate(
+            input_variables=["vector_context", "graph_context", "question"],
+            template=HYBRID_QA_TEMPLATE
+        )
+        self.synthesis_chain = final_prompt | self.llm
+
+    def _connect_vector_store(self):
+        """Vector backend picked by config.VECTOR_BACKEND: the Neo4j vector index or the local index."""
+        local_index = get_local_index()
+        if local_index is not None:
+            return self._connect_local_index(local_index)
         try:
-            self.vector_store = Neo4jVector.from_existing_graph(
+            return Neo4jVector.from_existing_graph(
                 embedding=self.embeddings,
-                url=config.NEO4J_URI,
-                username=config.NEO4J_USERNAME,
-                password=config.NEO4J_PASSWORD,
+                graph=self.graph,
                 index_name="vector_index",
                 node_label="Chunk",
                 text_node_properties=["text"],
@@ -82,67 +188,332 @@ class HybridRAG:
             )
         except Exception as e:
             print(f"⚠️ Vector index not found (graph empty?): {e}")
-            self.vector_store = None
+            return None
 
-        # 2. Setup Graph Chain
-        cypher_prompt = PromptTemplate(
-            input_variables=["schema", "question"],
-            template=CYPHER_GENERATION_TEMPLATE
-        )
-        self.graph_chain = GraphCypherQAChain.from_llm(
-            llm=self.llm,
-            graph=self.graph,
-            verbose=True,
-            allow_dangerous_requests=True,
-            cypher_prompt=cypher_prompt,
-            return_direct=True # Return raw data, let final LLM synthesize
-        )
+    def _connect_local_index(self, local_index):
+        """Rebuilds the local index from Neo4j when it is out of step with the Chunk nodes."""
+        try:
+            # Chunks MERGEd by GraphWriter before their embedding is written are not in the index yet
+            chunks = self.graph.query("MATCH (c:Chunk) WHERE c.embedding IS NOT NULL RETURN count(c) AS total")[0]["total"]
+            if chunks != len(local_index):
+                local_index.sync_from_graph(self.graph)
+        except Exception as e:
+            print(f"⚠️ Warning: Could not sync the local vector index: {e}")
+        return local_index
 
-    def query(self, user_question):
-        # A. Vector Search (Retrieving Sources)
-        vector_context = "No vector data found."
-        source_documents = [] # sources list
+    def refresh_if_stale(self):
+        """
+        Retries the vector index only when ingestion signalled a change or the
+        schema TTL expired. The schema itself is cached by database.get_schema.
+        """
+        version = database.get_graph_version(self.graph)
+        expired = time.time() - self._vector_checked_at > config.SCHEMA_REFRESH_TTL
+        if version == self._graph_version and not expired:
+            return
 
-        if self.vector_store:
-            try:
-                docs = self.vector_store.similarity_search(user_question, k=3)
-                vector_context = "\n".join([d.page_content for d in docs])
+        with self._lock:
+            if version == self._graph_version and time.time() - self._vector_checked_at <= config.SCHEMA_REFRESH_TTL:
+                return
+            if self.vector_store is None:
+                self.vector_store = self._connect_vector_store()
+            self._graph_version = version
+            self._vector_checked_at = time.time()
+        self._warned_unlinked = False
+
+    def _vector_search(self, user_question, trace):
+        """Semantic leg: returns the matching chunks as source documents."""
+        if not self.vector_store:
+            return []
 
-                for d in docs:
-                    source_documents.append({
-                        "content": d.page_content,
-                        "source": d.metadata.get("source", "Unknown"),
-                        "page": d.metadata.get("page", "N/A")
-                    })
+        with trace.span("query_embedding"):
+            embedding = self.embeddings.embed_query(user_question)
+        with trace.span("vector_search"):
+            docs = self.vector_store.similarity_search_by_vector(embedding, k=VECTOR_TOP_K)
+        source_documents = [{
+            "content": d.page_content,
+            "source": d.metadata.get("source", "Unknown"),
+            "page": d.metadata.get("page", "N/A")
+        } for d in docs]
+        return source_documents
 
+    def _graph_search(self, user_question, trace):
+        """
+        Structured leg: LLM-generated Cypher against the knowledge graph; returns its rows.
+        Cypher that already ran fine for the same question, model and schema is reused.
+        """
+        schema = database.get_schema(self.graph)
+        key = CypherCache.key(user_question, self.model_name, schema)
+
+        cypher = cypher_cache.get(key) if cypher_cache else None
+        if cypher is not None:
+            try:
+                with trace.span("cypher_execution"):
+                    return self.graph.query(cypher)[:GRAPH_RESULT_LIMIT]
             except Exception as e:
-                print(f"Vector search warning: {e}")
+                print(f"Cached Cypher failed, regenerating: {e}")
+                cypher_cache.discard(key)
+
+        with trace.span("cypher_generation"):
+            generated = self.cypher_chain.invoke({"schema": schema, "question": user_question})
+        cypher = rewrite_entity_lookup(extract_cypher(generated))
+        print(f"Generated Cypher: {cypher}")
+        with trace.span("cypher_execution"):
+            result = self.graph.query(cypher)[:GRAPH_RESULT_LIMIT]
+
+        if cypher_cache:
+            cypher_cache.store(key, cypher, question=user_question)
+        return result
+
+    def _expansion_search(self, user_question, trace):
+        """
+        Default leg: vector top-k chunks plus the neighbourhood of the entities they
+        mention, in one parameterized Cypher query (no Cypher-generation LLM call).
+        Returns (source_documents, triples, whether the chunks have MENTIONS links).
+        """
+        with trace.span("query_embedding"):
+            embedding = self.embeddings.embed_query(user_question)
+
+        hops = max(1, int(config.EXPANSION_HOPS))
+        params = {"k": VECTOR_TOP_K, "limit": config.EXPANSION_TRIPLE_LIMIT}
+        local_index = get_local_index()
+        if local_index is not None:
+            with trace.span("vector_search"):
+                docs = local_index.similarity_search_by_vector(embedding, k=VECTOR_TOP_K)
+            chunks = [{"text": d.page_content, **d.metadata} for d in docs]
+            query = CHUNK_EXPANSION_QUERY
+            params["ids"] = [d.id for d in docs]
+        else:
+            chunks = None
+            query = VECTOR_EXPANSION_QUERY
+            params.update(index="vector_index", embedding=embedding)
 
-        # B. Graph Search
-        graph_context = "No graph data found."
+        with trace.span("graph_expansion"):
+            rows = self.graph.query(query.format(entity=database.ENTITY_LABEL, hops=hops), params)
+        row = rows[0] if rows else {"chunks": [], "triples": [], "seeds": 0}
+        chunks = chunks if chunks is not None else row["chunks"]
+        linked = not chunks or row.get("seeds", 0) > 0
+
+        source_documents = [{
+            "content": c["text"],
+            "source": c.get("source") or "Unknown",
+            "page": c.get("page") if c.get("page") is not None else "N/A"
+        } for c in chunks]
+        return source_documents, row["triples"], linked
+
+    async def _run_leg(self, name, func, user_question, timeout, trace):
+        """
+        Runs a blocking retrieval leg on the shared retrieval executor with a timeout; never raises.
+        The leg writes into its own trace, merged only if it finishes in time. A leg that
+        times out keeps running in the background, but neither asyncio.run() (which only
+        joins its default executor) nor the request's trace waits for it.
+        """
+        start = time.perf_counter()
+        leg_trace = Trace(trace.kind)
+        loop = asyncio.get_running_loop()
         try:
-            graph_result = self.graph_chain.invoke({"query": user_question})
-            graph_context = str(graph_result.get('result', ''))
+            result = await asyncio.wait_for(
+                loop.run_in_executor(_retrieval_executor, func, user_question, leg_trace), timeout=timeout
+            )
+            trace.merge(leg_trace)
+            trace.record(name, time.perf_counter() - start)
+            return result
+        except asyncio.TimeoutError:
+            print(f"{name.capitalize()} search warning: timed out after {timeout}s")
+            trace.record(name, time.perf_counter() - start, "timeout")
         except Exception as e:
-            print(f"Graph search warning: {e}")
+            print(f"{name.capitalize()} search warning: {e}")
+            trace.record(name, time.perf_counter() - start, "error")
+        return None
 
-        # C. Hybrid Synthesis
-        final_prompt = PromptTemplate(
-            input_variables=["vector_context", "graph_context", "question"],
-            template=HYBRID_QA_TEMPLATE
-        )
+    async def _aretrieve(self, user_question, trace):
+        """
+        Runs retrieval (one expansion query, or the vector and graph legs concurrently)
+        and packs the results into the model's token budget.
+        Returns (synthesis inputs, sources, context stats).
+        """
+        await asyncio.to_thread(self.refresh_if_stale)
+
+        if config.RETRIEVAL_MODE == "expansion":
+            # A + B. Vector Search and Graph Expansion (one Cypher round trip)
+            result = await self._run_leg("expansion", self._expansion_search, user_question, config.EXPANSION_TIMEOUT, trace)
+            source_documents, graph_rows, linked = result or ([], [], True)
+            if not linked:
+                # Chunks from before MENTIONS links existed: the Cypher leg still reaches their entities
+                if not self._warned_unlinked:
+                    print("⚠️ Warning: Matched chunks have no MENTIONS links to entities; re-ingest the documents "
+                          "to enable graph expansion. Falling back to generated Cypher.")
+                    self._warned_unlinked = True
+                graph_rows = await self._run_leg("graph", self._graph_search, user_question, config.GRAPH_SEARCH_TIMEOUT, trace) or []
+        else:
+            # A + B. Vector and Graph Search (independent, run side by side)
+            vector_result, graph_result = await asyncio.gather(
+                self._run_leg("vector", self._vector_search, user_question, config.VECTOR_SEARCH_TIMEOUT, trace),
+                self._run_leg("graph", self._graph_search, user_question, config.GRAPH_SEARCH_TIMEOUT, trace)
+            )
+            source_documents, graph_rows = vector_result or [], graph_result or []
+
+        with trace.span("context_packing"):
+            packed = pack_context(user_question, source_documents, graph_rows, context_budget(self.model_name))
+            inputs = {
+                "vector_context": packed.vector_context or "No vector data found.",
+                "graph_context": packed.graph_context or "No graph data found.",
+                "question": user_question
+            }
+            context = self._prompt_stats(inputs, source_documents, graph_rows, packed.stats)
+        return inputs, packed.sources, context
+
+    def _prompt_stats(self, inputs, source_documents, graph_rows, stats):
+        """Synthesis prompt tokens, packed vs. what the unpacked results would have cost."""
+        raw_inputs = {
+            "vector_context": "\n".join(d["content"] for d in source_documents),
+            "graph_context": str(graph_rows),
+            "question": inputs["question"]
+        }
+        stats = dict(stats)
+        stats["prompt_tokens"] = count_tokens(HYBRID_QA_TEMPLATE.format(**inputs))
+        stats["raw_prompt_tokens"] = count_tokens(HYBRID_QA_TEMPLATE.format(**raw_inputs))
+        PROMPT_TOKENS.observe(stats["prompt_tokens"], model=self.model_name, kind="packed")
+        PROMPT_TOKENS.observe(stats["raw_prompt_tokens"], model=self.model_name, kind="raw")
+        return stats
+
+    def _lookup_answer(self, user_question, trace):
+        """Checks the semantic answer cache. Returns (cached result or None, question embedding)."""
+        if not config.ANSWER_CACHE_ENABLED:
+            return None, None
+
+        try:
+            answer_cache.sync(database.get_graph_version(self.graph))
+            with trace.span("query_embedding"):
+                embedding = self.embeddings.embed_query(user_question)
+            start = time.perf_counter()
+            cached = answer_cache.lookup(self.model_name, embedding)
+        except Exception as e:
+            print(f"Answer cache warning: {e}")
+            return None, None
+
+        trace.record("answer_cache", time.perf_counter() - start, "hit" if cached else "miss")
+        return cached, embedding
+
+    def _store_answer(self, user_question, embedding, answer, sources, timings):
+        """Caches the answer only if every retrieval leg completed normally."""
+        if embedding is None or any(timings.get(k, {}).get("status", "ok") != "ok" for k in ("vector", "graph", "expansion")):
+            return
+        answer_cache.store(self.model_name, user_question, embedding, {"answer": answer, "sources": sources})
 
-        chain = final_prompt | self.llm
-        response = chain.invoke({
-            "vector_context": vector_context,
-            "graph_context": graph_context,
-            "question": user_question
-        })
+    async def aquery(self, user_question):
+        """
+        Runs the vector and graph legs concurrently, then synthesizes an answer
+        from whatever came back in time. Per-stage latency is returned in 'timings' and
+        the packed prompt size in 'context'.
+        Near-duplicate questions are answered from the semantic answer cache.
+        """
+        trace = Trace("query")
+        cached, embedding = await asyncio.to_thread(self._lookup_answer, user_question, trace)
+        if cached:
+            return {"answer": cached["answer"], "sources": cached["sources"], "timings": trace.stages, "context": None}
+
+        inputs, source_documents, context = await self._aretrieve(user_question, trace)
+
+        # C. Hybrid Synthesis
+        # Sync invoke in a worker thread: the shared LLM's async HTTP client would be
+        # bound to the first asyncio.run() loop and fail once that loop is closed.
+        with trace.span("synthesis"):
+            response = await asyncio.to_thread(self.synthesis_chain.invoke, inputs)
+        self._store_answer(user_question, embedding, response.content, source_documents, trace.stages)
 
         return {
             "answer": response.content,
-            "sources": source_documents
+            "sources": source_documents,
+            "timings": trace.stages,
+            "context": context
         }
 
-def get_qa_chain(graph_db, model_name, verbose=True):
-    return HybridRAG(graph_db, model_name)
\ No newline at end of file
+    def query(self, user_question):
+        """Synchronous wrapper around aquery (must not be called from a running event loop)."""
+        return asyncio.run(self.aquery(user_question))
+
+    def stream_query(self, user_question):
+        """
+        Runs retrieval now and returns an AnswerStream that yields synthesis tokens.
+        Sources are available right away; answer and timings are complete once it is consumed.
+        """
+        started_at = time.perf_counter()
+        trace = Trace("query")
+        cached, embedding = self._lookup_answer(user_question, trace)
+        if cached:
+            return AnswerStream(None, None, cached["sources"], trace, started_at, answer=cached["answer"])
+
+        inputs, source_documents, context = asyncio.run(self._aretrieve(user_question, trace))
+        return AnswerStream(
+            self.synthesis_chain, inputs, source_documents, trace, started_at, context=context,
+            on_complete=lambda stream: self._store_answer(user_question, embedding, stream.answer, stream.sources, stream.timings)
+        )
+
+class AnswerStream:
+    """
+    Iterable of answer tokens (e.g. for st.write_stream) that records time-to-first-token.
+    Without a chain it replays a ready answer (cache hits, which have no context stats).
+    """
+    def __init__(self, chain, inputs, sources, trace, started_at, answer="", context=None, on_complete=None):
+        self.chain = chain
+        self.inputs = inputs
+        self.sources = sources
+        self.trace = trace
+        self.context = context
+        self.started_at = started_at
+        self.answer = answer
+        self.on_complete = on_complete
+
+    @property
+    def timings(self):
+        return self.trace.stages
+
+    def __iter__(self):
+        if self.chain is None:
+            self.trace.record("first_token", time.perf_counter() - self.started_at)
+            yield self.answer
+            return
+
+        start = time.perf_counter()
+        parts = []
+        for chunk in self.chain.stream(self.inputs):
+            if not chunk.content:
+                continue
+            if not parts:
+                # Measured from the moment the question was received
+                self.trace.record("first_token", time.perf_counter() - self.started_at)
+            parts.append(chunk.content)
+            yield chunk.content
+
+        self.trace.record("synthesis", time.perf_counter() - start)
+        self.answer = "".join(parts)
+        if self.on_complete:
+            self.on_complete(self)
+
+# --- CYPHER CACHE ---
+cypher_cache = CypherCache(
+    config.CYPHER_CACHE_MAX_ENTRIES, config.CYPHER_CACHE_HISTORY_PATH
+) if config.CYPHER_CACHE_ENABLED else None
+
+# --- ANSWER CACHE ---
+# Shared by all engines; namespaced per model and cleared when the graph changes.
+answer_cache = SemanticAnswerCache(config.ANSWER_CACHE_SIMILARITY, config.ANSWER_CACHE_MAX_ENTRIES, config.ANSWER_CACHE_TTL)
+
+# --- ENGINE REGISTRY ---
+# One long-lived HybridRAG per model, shared by every chat message and session.
+# Long-lived pool for retrieval legs, so timed-out legs never block asyncio.run()
+_retrieval_executor = ThreadPoolExecutor(max_workers=config.RETRIEVAL_WORKERS, thread_name_prefix="mimir-retrieval")
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_qa_chain(graph_db=None, model_name=None, verbose=True):
+    """Returns the shared HybridRAG engine for the model, building it on first use."""
+    model_name = model_name or config.DEFAULT_MODEL
+
+    with _engines_lock:
+        engine = _engines.get(model_name)
+        if engine is None:
+            engine = HybridRAG(graph_db or database.get_graph_db(), model_name)
+            _engines[model_name] = engine
+    return engine
\ No newline at end of file
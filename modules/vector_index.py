@@ -0,0 +1,345 @@
+# This file is part of Mimir.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import sqlite3
+import threading
+import numpy as np
+from langchain_core.documents import Document
+import config
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+class LocalVectorIndex:
+    """
+    On-disk chunk vector index used instead of the Neo4j vector index when
+    VECTOR_BACKEND = "local" (no Bolt round trip per question).
+
+    Vectors are L2-normalized float32 rows appended to a memory-mapped file;
+    chunk ids, text and metadata live in SQLite. Replaced or deleted chunks
+    leave orphan rows behind, which compact() rewrites away.
+    Search is exact (one matrix product over the memmap) or, when hnswlib is
+    installed and LOCAL_VECTOR_HNSW is on, an HNSW graph saved next to the matrix.
+    Writes from other processes (e.g. the ingest CLI) are picked up through a
+    version counter checked before every search: appends and deletes update the
+    loaded HNSW graph in place, and only a changed row layout (compact, clear)
+    or a fresh process reloads it.
+    """
+    def __init__(self, directory, use_hnsw=config.LOCAL_VECTOR_HNSW, ef=config.LOCAL_VECTOR_EF):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.hnsw_path = os.path.join(directory, "hnsw.bin")
+        self.use_hnsw = use_hnsw and hnswlib is not None
+        self.ef = ef
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "chunks.sqlite"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, row INTEGER NOT NULL, source TEXT, text TEXT, metadata TEXT)"
+        )
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS chunks_row ON chunks (row)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        # Loaded lazily by the first search
+        self._loaded_version = None
+        self._loaded_layout = None
+        self._matrix = None
+        self._live = None
+        self._hnsw = None
+
+    # --- METADATA ---
+
+    def _meta(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _bump_version(self, layout=False):
+        """Every write bumps the version; layout=True also marks row numbers as reassigned."""
+        version = int(self._meta("version", 0)) + 1
+        self._set_meta("version", version)
+        if layout:
+            self._set_meta("layout", version)
+
+    @property
+    def dimension(self):
+        dim = self._meta("dim")
+        return int(dim) if dim else None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM chunks").fetchone()[0]
+
+    # --- WRITES ---
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None, **kwargs):
+        """Upserts chunks (same signature as Neo4jVector.add_embeddings)."""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(i) for i in range(len(texts))]
+
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                dim = self.dimension
+                if dim is None:
+                    dim = vectors.shape[1]
+                    self._set_meta("dim", dim)
+                elif dim != vectors.shape[1]:
+                    raise ValueError(f"Embedding dimension changed ({dim} -> {vectors.shape[1]}); rebuild the local index")
+
+                # Next row comes from the file itself; a torn write from a crash is cut off
+                row_bytes = dim * 4
+                size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+                with open(self.vectors_path, "ab") as f:
+                    if size % row_bytes:
+                        f.truncate(size - size % row_bytes)
+                    first_row = size // row_bytes
+                    f.write(vectors.tobytes())
+
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (id, row, source, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (chunk_id, first_row + i, metadata.get("source"), text, json.dumps(metadata, default=str))
+                        for i, (chunk_id, text, metadata) in enumerate(zip(ids, texts, metadatas))
+                    ]
+                )
+                self._bump_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def delete(self, ids):
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+            self._bump_version()
+            self._conn.execute("COMMIT")
+        self._compact_if_sparse()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM meta WHERE key = 'dim'")
+            for path in (self.vectors_path, self.hnsw_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._bump_version(layout=True)
+            self._conn.execute("COMMIT")
+            self._matrix = self._live = self._hnsw = None
+
+    def _compact_if_sparse(self):
+        dim = self.dimension
+        if not dim or not os.path.exists(self.vectors_path):
+            return
+        total_rows = os.path.getsize(self.vectors_path) // (dim * 4)
+        if total_rows > 1000 and len(self) < total_rows // 2:
+            self.compact()
+
+    def compact(self):
+        """Rewrites the vector file with live rows only."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                dim = self.dimension
+                rows = self._conn.execute("SELECT id, row FROM chunks ORDER BY row").fetchall()
+                if dim and rows:
+                    matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r").reshape(-1, dim)
+                    tmp_path = self.vectors_path + ".tmp"
+                    with open(tmp_path, "wb") as f:
+                        for start in range(0, len(rows), 10_000):
+                            batch = [row for _, row in rows[start:start + 10_000]]
+                            f.write(np.ascontiguousarray(matrix[batch]).tobytes())
+                    del matrix
+                    os.replace(tmp_path, self.vectors_path)
+                    self._conn.executemany(
+                        "UPDATE chunks SET row = ? WHERE id = ?", [(-1 - i, chunk_id) for i, (chunk_id, _) in enumerate(rows)]
+                    )
+                    self._conn.execute("UPDATE chunks SET row = -1 - row")
+                elif os.path.exists(self.vectors_path):
+                    os.remove(self.vectors_path)
+                self._bump_version(layout=True)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def sync_from_graph(self, graph, batch_size=1000):
+        """Rebuilds the index from the Chunk nodes (and their embeddings) stored in Neo4j."""
+        self.clear()
+        after = ""
+        total = 0
+        while True:
+            rows = graph.query("""
+            MATCH (c:Chunk) WHERE c.id > $after AND c.embedding IS NOT NULL
+            RETURN c.id AS id, c.text AS text, c.embedding AS embedding,
+                   c {.*, text: null, embedding: null} AS metadata
+            ORDER BY c.id LIMIT $limit
+            """, {"after": after, "limit": batch_size})
+            if not rows:
+                break
+            self.add_embeddings(
+                [row["text"] for row in rows],
+                [row["embedding"] for row in rows],
+                metadatas=[{k: v for k, v in row["metadata"].items() if v is not None} for row in rows],
+                ids=[row["id"] for row in rows]
+            )
+            total += len(rows)
+            after = rows[-1]["id"]
+        print(f"🧭 Local vector index rebuilt from Neo4j ({total} chunks)")
+        return total
+
+    # --- SEARCH ---
+
+    def _ensure_loaded(self):
+        """
+        Picks up writes made since the last search. Appends and deletes only remap the
+        vector file and patch the HNSW graph; a layout change (compact, clear) reloads.
+        """
+        with self._lock:
+            version = self._meta("version", "0")
+            if version == self._loaded_version:
+                return
+            layout = self._meta("layout", "0")
+            dim = self.dimension
+            rows = np.fromiter((row for (row,) in self._conn.execute("SELECT row FROM chunks")), dtype=np.int64)
+            if not dim or not len(rows) or not os.path.exists(self.vectors_path):
+                self._matrix, self._live, self._hnsw = None, None, None
+                self._loaded_version, self._loaded_layout = version, layout
+                return
+
+            matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r").reshape(-1, dim)
+            live = np.zeros(len(matrix), dtype=bool)
+            live[rows[rows < len(matrix)]] = True
+
+            if self.use_hnsw and self._hnsw is not None and layout == self._loaded_layout:
+                self._update_hnsw(matrix, live)
+            elif self.use_hnsw:
+                self._matrix, self._live = matrix, live
+                self._hnsw = self._load_hnsw(dim, version)
+            else:
+                self._hnsw = None
+            self._matrix, self._live = matrix, live
+            self._loaded_version, self._loaded_layout = version, layout
+
+    def _update_hnsw(self, matrix, live):
+        """Adds the rows appended since the last load and marks the dropped ones deleted."""
+        previous = np.zeros(len(live), dtype=bool)
+        previous[:len(self._live)] = self._live
+        added = np.flatnonzero(live & ~previous)
+        for row in np.flatnonzero(previous & ~live):
+            self._hnsw.mark_deleted(int(row))
+        if len(added):
+            needed = self._hnsw.get_current_count() + len(added)
+            if needed > self._hnsw.get_max_elements():
+                self._hnsw.resize_index(max(needed, 2 * self._hnsw.get_max_elements()))
+            for start in range(0, len(added), 10_000):
+                batch = added[start:start + 10_000]
+                self._hnsw.add_items(np.asarray(matrix[batch]), batch)
+
+    def _load_hnsw(self, dim, version):
+        """Reuses the saved HNSW graph if it matches the index version, else builds and saves one."""
+        index = hnswlib.Index(space="ip", dim=dim)
+        if os.path.exists(self.hnsw_path) and self._meta("hnsw_version") == version:
+            index.load_index(self.hnsw_path, max_elements=len(self._matrix))
+        else:
+            live_rows = np.flatnonzero(self._live)
+            index.init_index(max_elements=max(1, len(live_rows)), ef_construction=200, M=16)
+            for start in range(0, len(live_rows), 10_000):
+                batch = live_rows[start:start + 10_000]
+                index.add_items(np.asarray(self._matrix[batch]), batch)
+            index.save_index(self.hnsw_path)
+            self._set_meta("hnsw_version", version)
+        index.set_ef(max(self.ef, 1))
+        return index
+
+    def search(self, embedding, k=4):
+        """Returns [(row, cosine score)] of the k nearest live chunks."""
+        self._ensure_loaded()
+        matrix, live, hnsw = self._matrix, self._live, self._hnsw
+        if matrix is None:
+            return []
+
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        k = min(k, int(live.sum()))
+        if k == 0:
+            return []
+
+        if hnsw is not None:
+            labels, distances = hnsw.knn_query(query, k=k)
+            return [(int(row), 1 - float(d)) for row, d in zip(labels[0], distances[0])]
+
+        scores = np.asarray(matrix @ query)
+        scores[~live] = -np.inf
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        hits = self.search(embedding, k)
+        if not hits:
+            return []
+        rows = {row: score for row, score in hits}
+        placeholders = ",".join("?" * len(rows))
+        with self._lock:
+            found = self._conn.execute(
+                f"SELECT row, id, text, metadata FROM chunks WHERE row IN ({placeholders})", list(rows)
+            ).fetchall()
+        by_row = {row: Document(id=chunk_id, page_content=text, metadata=json.loads(metadata))
+                  for row, chunk_id, text, metadata in found}
+        return [(by_row[row], score) for row, score in hits if row in by_row]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        """Same interface as Neo4jVector.similarity_search_by_vector."""
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+_local_index = None
+_local_index_lock = threading.Lock()
+
+def get_local_index():
+    """Process-wide local index, or None unless VECTOR_BACKEND is 'local'."""
+    global _local_index
+    if config.VECTOR_BACKEND != "local":
+        return None
+    with _local_index_lock:
+        if _local_index is None:
+            _local_index = LocalVectorIndex(config.LOCAL_VECTOR_DIR)
+        return _local_index